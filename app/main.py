@@ -1,11 +1,50 @@
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi import FastAPI
 from app.routes_chat import router as chat_router
 from app.routes_admin import router as admin_router
+from core.decision_cache import attach_to_mirror as attach_decision_cache
+from core.intent_extractor import SMALL_MODEL
+from core.llm_client import BIG_MODEL, EMBED_MODEL, aclose_http as aclose_llm_http, warmup
+from core.summarizer import get_summarizer
+from data.message_log import get_message_log
+from data.repo import dispose_engine, get_engine
+from ha.client import aclose_http as aclose_ha_http
+from ha.executor import attach_to_mirror as attach_executor
+from ha.state_mirror import start_mirror, stop_mirror
 from utils.logging import configure_logging
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # startup: open the DB pool (creates tables/indexes) off the event loop
+    await asyncio.to_thread(get_engine)
+    get_message_log().start()
+    summarizer = get_summarizer()
+    if summarizer is not None:
+        summarizer.start()
+    # WebSocket state mirror (HA_WS_MIRROR=0 to serve state over REST only)
+    mirror = await start_mirror()
+    # state changes drop cached decisions for the entities involved
+    attach_decision_cache(mirror)
+    # ... and confirm fire-and-forget executions
+    attach_executor(mirror)
+    # load the models in the background so the first turn doesn't pay a cold load; /ready reports progress
+    warm = asyncio.create_task(warmup([SMALL_MODEL, BIG_MODEL], [EMBED_MODEL]))
+    yield
+    # shutdown: stop background work, then release pooled keep-alive connections
+    warm.cancel()
+    if summarizer is not None:
+        await summarizer.stop()
+    await stop_mirror()
+    await aclose_ha_http()
+    await aclose_llm_http()
+    # write out buffered chat history before the pool goes away
+    await get_message_log().close()
+    dispose_engine()
+
 def create_app() -> FastAPI:
     configure_logging()
-    app = FastAPI(title="SmartHub", version="0.1.0")
+    app = FastAPI(title="SmartHub", version="0.1.0", lifespan=lifespan)
     app.include_router(chat_router, prefix="/chat", tags=["chat"])
     app.include_router(admin_router, tags=["admin"])
     return app
@@ -1,7 +1,77 @@
 from fastapi import APIRouter
+import httpx
+from core.intent_extractor import SMALL_MODEL
+from core.decision_cache import get_decision_cache
+from core.fast_path import get_fast_path
+from core.llm_client import BIG_MODEL, EMBED_MODEL, OllamaClient, get_scheduler
+from core.router import get_router
+from core.summarizer import get_summarizer
+from data.embed_cache import get_cache
+from data.message_log import get_message_log
+from ha.executor import get_executor
+from ha.services import get_registry
 
 router = APIRouter()
 
 @router.get("/health")
 async def health():
     return {"ok": True}
+
+def _same_model(a: str, b: str) -> bool:
+    # Ollama reports "nomic-embed-text:latest" for "nomic-embed-text"
+    norm = lambda m: m if ":" in m else f"{m}:latest"
+    return norm(a) == norm(b)
+
+@router.get("/ready")
+async def ready():
+    expected = [SMALL_MODEL, BIG_MODEL, EMBED_MODEL]
+    try:
+        resident = await OllamaClient().resident_models()
+    except httpx.HTTPError as e:
+        return {"ready": False, "error": f"ollama: {type(e).__name__}", "expected": expected, "resident": []}
+    models = {m: any(_same_model(m, r) for r in resident) for m in expected}
+    return {"ready": all(models.values()), "models": models, "resident": resident}
+
+@router.post("/admin/services/refresh")
+async def refresh_services():
+    reg = get_registry()
+    await reg.refresh()
+    return {"ok": True, "version": reg.version}
+
+@router.get("/admin/embed_cache")
+async def embed_cache_stats():
+    cache = get_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+@router.get("/admin/fast_path")
+async def fast_path_stats():
+    fp = get_fast_path()
+    return fp.stats() if fp is not None else {"enabled": False}
+
+@router.get("/admin/decision_cache")
+async def decision_cache_stats():
+    cache = get_decision_cache()
+    return cache.stats() if cache is not None else {"enabled": False}
+
+@router.get("/admin/llm_scheduler")
+async def llm_scheduler_stats():
+    return get_scheduler().stats()
+
+@router.get("/admin/router")
+async def router_stats():
+    r = get_router()
+    return r.stats() if r is not None else {"enabled": False}
+
+@router.get("/admin/history")
+async def history_stats():
+    return get_message_log().stats()
+
+@router.get("/admin/summarizer")
+async def summarizer_stats():
+    s = get_summarizer()
+    return s.stats() if s is not None else {"enabled": False}
+
+@router.get("/admin/executions")
+async def execution_stats(recent: int = 20):
+    ex = get_executor()
+    return {**ex.stats(), "recent": [e.model_dump() for e in ex.recent(recent)]}
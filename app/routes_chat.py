@@ -1,13 +1,17 @@
-from fastapi import APIRouter
+import json
+import os
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Any, Dict
-from data.repo import Repo
-from core.intent_extractor import extract_intent_or_reply
-from core.resolver import build_bundle_from_intent
-from core.decide_and_reply import decide_and_reply
-from ha.client import HAClient
+from typing import Any, Dict, List
+from data.message_log import get_message_log
+from core.big_llm import Decision
+from core.interface import Interface
+from core.summarizer import get_summarizer
+from ha.executor import Execution, commands_from_decision, get_executor
 
 router = APIRouter()
+_iface = Interface()
 
 class TurnIn(BaseModel):
     chat_id: str
@@ -15,57 +19,102 @@ class TurnIn(BaseModel):
     context: Dict[str, Any] = Field(default_factory=dict)
     tenant_id: str | None = None
 
+FALLBACK_REPLY = "Sorry, I need more details."
+# how long /turn/stream holds "done" back for the execution outcome (it stays queryable afterwards)
+EXEC_STREAM_WAIT_S = float(os.getenv("EXEC_STREAM_WAIT_S", "5"))
+
+def _execute(items: List[Dict[str, Any]]) -> Execution | None:
+    # one execution for all of a turn's commands ({device, action, args} each); fire and return,
+    # the executor batches targets and confirms from state changes
+    commands = [c for it in items for c in commands_from_decision(it.get("device"), it.get("action"), it.get("args"))]
+    return get_executor().submit(commands) if commands else None
+
+def _targets(decisions: List[Decision]) -> List[Dict[str, Any]]:
+    return [d.model_dump(include={"device", "action", "args"}) for d in decisions if d.is_execute]
+
+def _executed_event(exe: Execution) -> Dict[str, Any]:
+    return {
+        "type": "executed",
+        "ok": exe.status == "ok",
+        "status": exe.status,            # pending if still running after EXEC_STREAM_WAIT_S
+        "confirmed": exe.confirmed,
+        "execution_id": exe.id,
+        "service": ",".join(dict.fromkeys(g.action for g in exe.groups)),
+        "errors": [g.error for g in exe.groups if g.error],
+    }
+
+def _reply_text(decision: Decision | None) -> str:
+    return (decision.reply_text if decision else None) or FALLBACK_REPLY
+
+async def _persist(body: TurnIn, reply: str) -> None:
+    # buffer the turn (written to the DB in the background); summaries are refreshed off-path
+    await get_message_log().add_turn(body.chat_id, body.user_last_message, reply, tenant_id=body.tenant_id)
+    summarizer = get_summarizer()
+    if summarizer is not None:
+        summarizer.note_messages(body.chat_id, 2)
+
 @router.post("/turn")
 async def chat_turn(body: TurnIn):
-    repo = Repo()
-    ha = HAClient()
-
-    # 1) persist user msg
-    repo.add_message(body.chat_id, "user", body.user_last_message)
-
-    # 2) small LLM → intent or plain reply
-    intent_or_reply = await extract_intent_or_reply(
-        message=body.user_last_message,
-        context=body.context,
-        summary=repo.load_summary(body.chat_id)
-    )
-    if intent_or_reply["mode"] == "reply":
-        reply = intent_or_reply["text"]
-        repo.add_message(body.chat_id, "assistant", reply)
-        repo.update_summary(body.chat_id, body.user_last_message, reply)
-        return {"reply": reply}
-
-    # 3) resolver → bundle
-    bundle = await build_bundle_from_intent(repo, intent_or_reply["intent"], body.context)
-
-    # 4) large LLM: Decide & Reply (bounded loop if it asks to fetch more)
-    for _ in range(2):
-        decision = await decide_and_reply(bundle=bundle, summary=repo.load_summary(body.chat_id))
-        mode = decision.get("mode")
-        if mode == "REPLY":
-            reply = decision["text"]
-            repo.add_message(body.chat_id, "assistant", reply)
-            repo.update_summary(body.chat_id, body.user_last_message, reply)
-            return {"reply": reply}
-        if mode == "FETCH_MORE":
-            # Minimal demo: we only handle a sample fetch kind
-            if decision.get("fetch") == "devices_for_area":
-                area = decision.get("params", {}).get("area")
-                extra = repo.devices_for_area(area)
-                bundle["candidates"].extend(extra)
-                continue
-            return {"reply": "Need more info to proceed."}
-        if mode == "EXECUTE_AND_REPLY":
-            # Validate again (defense in depth)
-            # In demo we trust args; production: repo.full_validate(...)
-            _ = decision["args"]
-            tool_result = await ha.execute(decision["device_id"], decision["action_id"], decision["args"])
-            reply = decision["reply_text"]
-            repo.add_message(body.chat_id, "assistant", reply)
-            repo.update_summary(body.chat_id, body.user_last_message, reply)
-            return {"reply": reply}
-
-    # fallback
-    reply = "Sorry, I need more details."
-    repo.add_message(body.chat_id, "assistant", reply)
-    return {"reply": reply}
+    get_message_log().prefetch(body.chat_id)
+
+    # 1) small LLM keywords -> retrieval -> big LLM decision
+    result = await _iface.handle_message(body.user_last_message, body.context, chat_id=body.chat_id)
+    decision: Decision | None = result["parsed"]
+
+    # 2) execute if asked (every command of a split message at once): dispatched in the
+    #    background, outcome at /chat/executions/{id}
+    exe = _execute(_targets(result["decisions"]))
+    reply = _reply_text(decision)
+
+    # 3) persist
+    await _persist(body, reply)
+    return {"reply": reply, "execution_id": exe.id if exe else None}
+
+@router.get("/executions/{execution_id}")
+async def execution_status(execution_id: str, wait: float = 0.0):
+    """Outcome of a /turn execution; `wait` seconds blocks until it finishes (bounded by 30s)."""
+    exe = await get_executor().wait(execution_id, min(max(wait, 0.0), 30.0))
+    if exe is None:
+        raise HTTPException(status_code=404, detail="unknown execution")
+    return exe.model_dump()
+
+@router.post("/turn/stream")
+async def chat_turn_stream(body: TurnIn):
+    """
+    Streaming /turn as NDJSON lines:
+      {"type":"delta","text":"..."}          reply text as the big LLM writes it
+      {"type":"executed","ok":true|false,...} HA call outcome and confirmation (the call starts
+                                             as soon as device/action/args are complete, mid-generation)
+      {"type":"done","reply":"..."}          final reply, once the turn is in the message log
+    """
+    get_message_log().prefetch(body.chat_id)
+
+    async def gen():
+        exe: Execution | None = None
+        streamed = []
+        decision = None
+        decisions: List[Decision] = []
+        async for ev in _iface.stream_message(body.user_last_message, body.context, chat_id=body.chat_id):
+            if ev["type"] == "delta":
+                streamed.append(ev["text"])
+                yield json.dumps({"type": "delta", "text": ev["text"]}, ensure_ascii=False) + "\n"
+            elif ev["type"] == "execute":
+                exe = _execute(ev.get("commands") or [ev])
+            elif ev["type"] == "decision":
+                decision = ev["decision"]
+                decisions = ev.get("decisions") or ([decision] if decision else [])
+
+        if exe is None:
+            exe = _execute(_targets(decisions))
+        reply = _reply_text(decision)
+        if not streamed:
+            # nothing was streamed (no reply field / unparsable output): send it whole
+            yield json.dumps({"type": "delta", "text": reply}, ensure_ascii=False) + "\n"
+        if exe is not None:
+            exe = await get_executor().wait(exe.id, EXEC_STREAM_WAIT_S) or exe
+            yield json.dumps(_executed_event(exe)) + "\n"
+
+        await _persist(body, reply)
+        yield json.dumps({"type": "done", "reply": reply}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(gen(), media_type="application/x-ndjson")
@@ -1,7 +1,11 @@
 # core/big_llm.py
 import json
-from typing import Any, Dict, List
-from core.llm_client import OllamaClient
+import os
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple, Union
+from pydantic import BaseModel, Field
+from core.bundle import REPLY_RESERVE, estimate_tokens
+from core.llm_client import PRIORITY_INTERACTIVE, OllamaClient, num_ctx_for
 
 SYSTEM = """
 You are the single-turn decision & reply layer for a smart-home assistant.
@@ -10,6 +14,8 @@ Return EXACTLY ONE LINE JSON (no prose). One of:
 {"mode":"EXECUTE","device":"<entity_id>","action":"<domain.service>","args":{},"reply":"<short confirmation>"}
 {"mode":"REPLY","text":"<short answer>"}
 
+"device" may be a list of entity_ids when the same action and args apply to all of them.
+
 Inputs:
 - user_message, context, recent, keywords
 - devices: [{entity_id, name, domain, area}]
@@ -17,25 +23,153 @@ Inputs:
 Output ONE line of JSON only.
 """
 
+# "prefix": static system prompt + canonically sorted catalog first, per-turn data last,
+#           so consecutive prompts share a long prefix Ollama can reuse from its KV cache
+# "legacy": everything in one user blob, message first, candidates in score order
+PROMPT_LAYOUT = os.getenv("PROMPT_LAYOUT", "prefix").strip().lower()
+
+# Ollama `format` constraint: both shapes of SYSTEM in one flat object
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "mode": {"type": "string", "enum": ["EXECUTE", "REPLY"]},
+        "device": {"anyOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}]},
+        "action": {"type": "string"},
+        "args": {"type": "object"},
+        "reply": {"type": "string"},
+        "text": {"type": "string"},
+    },
+    "required": ["mode"],
+}
+
+class Decision(BaseModel):
+    mode: Literal["EXECUTE", "REPLY"]
+    device: Optional[Union[str, List[str]]] = None  # one entity_id or several sharing action + args
+    action: Optional[str] = None
+    args: Dict[str, Any] = Field(default_factory=dict)
+    reply: Optional[str] = None
+    text: Optional[str] = None
+
+    @classmethod
+    def from_obj(cls, obj: Any) -> Optional["Decision"]:
+        if not isinstance(obj, dict):
+            return None
+        try:
+            return cls.model_validate({**obj, "args": obj.get("args") or {}})
+        except Exception:
+            return None
+
+    @property
+    def is_execute(self) -> bool:
+        return self.mode == "EXECUTE" and bool(self.targets) and bool(self.action)
+
+    @property
+    def targets(self) -> List[str]:
+        if isinstance(self.device, str):
+            return [self.device] if self.device else []
+        return [d for d in self.device or [] if d]
+
+    @property
+    def reply_text(self) -> Optional[str]:
+        return self.reply or self.text
+
+def _json(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+def _user_blob(user_message: str, context: Dict[str, Any], devices, actions, recent_json: str = "") -> str:
+    return (
+        f"user_message={json.dumps(user_message)}\n"
+        f"context={json.dumps(context, ensure_ascii=False, separators=(',',':'))}\n"
+        + (f"recent={recent_json}\n" if recent_json else "")
+        + f"devices={json.dumps(devices, ensure_ascii=False, separators=(',',':'))}\n"
+        f"actions={json.dumps(actions, ensure_ascii=False, separators=(',',':'))}"
+    )
+
+def catalog_section(devices: List[Dict[str, Any]], actions: List[Dict[str, Any]]) -> str:
+    """
+    This turn's candidates in canonical order (action / entity_id, sorted keys): same
+    set -> same bytes. It is the retrieved set, not the whole home, so the KV prefix
+    is shared only as far as two turns' candidates agree. Actions go first: they are
+    expanded per domain and change less from turn to turn than the devices do.
+    """
+    devs = sorted(devices, key=lambda d: str(d.get("entity_id")))
+    acts = sorted(actions, key=lambda a: str(a.get("action")))
+    return f"actions={_json(acts)}\ndevices={_json(devs)}"
+
+def build_prompt(
+    user_message: str, context: Dict[str, Any], devices, actions, layout: Optional[str] = None,
+    recent_json: str = "",
+) -> Tuple[str, str]:
+    """-> (system, prompt) for /api/generate in the given PROMPT_LAYOUT; recent_json is the chat history."""
+    if (layout or PROMPT_LAYOUT) == "legacy":
+        return SYSTEM, _user_blob(user_message, context, devices, actions, recent_json)
+    system = f"{SYSTEM.strip()}\n\n{catalog_section(devices, actions)}"
+    prompt = f"context={_json(context)}\n"
+    if recent_json:
+        prompt += f"recent={recent_json}\n"
+    prompt += f"user_message={json.dumps(user_message, ensure_ascii=False)}"
+    return system, prompt
+
+def _prepare(user_message, context, devices, actions, model, num_ctx, layout, recent_json):
+    system, prompt = build_prompt(user_message, context, devices, actions, layout, recent_json)
+    # num_ctx stays fixed per model (a new value reloads it); an oversized prompt is only logged
+    num_ctx = num_ctx or num_ctx_for(model)
+    need = estimate_tokens(system + prompt) + REPLY_RESERVE
+    if need > num_ctx:
+        print(f"[big-llm] prompt needs ~{need} tokens but {model} runs with num_ctx={num_ctx}; "
+              f"Ollama will truncate it (lower BUNDLE_TOKEN_BUDGET or raise its num_ctx)")
+    return system, prompt, num_ctx
+
 async def run_big_llm(
     user_message: str,
     context: Dict[str, Any],
-    # recent_json: str,
-    # keywords_text: str,
     devices: List[Dict[str, Any]],
     actions: List[Dict[str, Any]],
     model: str = "qwen2.5:7b-instruct",
+    num_ctx: Optional[int] = None,
+    layout: Optional[str] = None,
+    meta: Optional[Dict[str, Any]] = None,
+    priority: int = PRIORITY_INTERACTIVE,
+    recent_json: str = "",
 ) -> str:
-    user_blob = (
-        f"user_message={json.dumps(user_message)}\n"
-        f"context={json.dumps(context, ensure_ascii=False, separators=(',',':'))}\n"
-        # f"recent={recent_json}\n"
-        f"devices={json.dumps(devices, ensure_ascii=False, separators=(',',':'))}\n"
-        f"actions={json.dumps(actions, ensure_ascii=False, separators=(',',':'))}"
+    """
+    One decision as raw JSON text. recent_json (core.history.compact_recent) is the
+    chat history; meta (if given) receives Ollama's final-message stats (prompt_eval_count...).
+    """
+    system, prompt, num_ctx = _prepare(
+        user_message, context, devices, actions, model, num_ctx, layout, recent_json,
+    )
+    meta = {} if meta is None else meta
+    _, raw = await OllamaClient().chat_json(
+        system,
+        [{"role":"user","content":prompt}],
+        model=model,
+        schema=SCHEMA,
+        num_ctx=num_ctx,
+        meta=meta,
+        priority=priority,
+    )
+    return raw
+
+async def stream_big_llm(
+    user_message: str,
+    context: Dict[str, Any],
+    devices: List[Dict[str, Any]],
+    actions: List[Dict[str, Any]],
+    model: str = "qwen2.5:7b-instruct",
+    num_ctx: Optional[int] = None,
+    layout: Optional[str] = None,
+    recent_json: str = "",
+) -> AsyncIterator[str]:
+    """
+    Streaming run_big_llm: yields raw decision text chunks as they are generated.
+    """
+    system, prompt, num_ctx = _prepare(
+        user_message, context, devices, actions, model, num_ctx, layout, recent_json,
     )
-    out = await OllamaClient().chat(
-        SYSTEM,
-        [{"role":"user","content":user_blob}],
-        model=model
+    stream = OllamaClient().chat_stream(
+        system, [{"role":"user","content":prompt}], model=model, fmt=SCHEMA, num_ctx=num_ctx,
     )
-    return out.strip() if isinstance(out, str) else str(out)
+    async with aclosing(stream):
+        async for piece in stream:
+            yield piece
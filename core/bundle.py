@@ -0,0 +1,122 @@
+# core/bundle.py
+import json
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from core.llm_client import BIG_NUM_CTX
+
+# rough chars-per-token for English + JSON on llama/qwen tokenizers
+CHARS_PER_TOKEN = float(os.getenv("BUNDLE_CHARS_PER_TOKEN", "3.5"))
+# tokens of BIG_NUM_CTX kept for the model's answer
+REPLY_RESERVE = int(os.getenv("BUNDLE_REPLY_RESERVE", "256"))
+# tokens of BIG_NUM_CTX kept for everything but the candidates: system prompt,
+# context, chat history (HISTORY_TOKEN_BUDGET) and the user message
+PROMPT_RESERVE = int(os.getenv("BUNDLE_PROMPT_RESERVE", "1024"))
+# candidate budget for the big LLM prompt (devices + actions JSON only); never more
+# than what is left of BIG_NUM_CTX, which is fixed (changing num_ctx reloads the model)
+_FITS = max(256, BIG_NUM_CTX - REPLY_RESERVE - PROMPT_RESERVE)
+BUNDLE_TOKEN_BUDGET = int(os.getenv("BUNDLE_TOKEN_BUDGET", str(min(1200, _FITS))))
+if BUNDLE_TOKEN_BUDGET > _FITS:
+    print(f"[bundle] BUNDLE_TOKEN_BUDGET={BUNDLE_TOKEN_BUDGET} does not fit BIG_NUM_CTX={BIG_NUM_CTX}; using {_FITS}")
+    BUNDLE_TOKEN_BUDGET = _FITS
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def _compact(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def project_device(entity_id: str, state: Dict[str, Any]) -> Dict[str, Any]:
+    """(entity_id, HA state) -> {entity_id, name, domain, area?} as documented in big_llm.SYSTEM."""
+    attrs = (state or {}).get("attributes") or {}
+    out = {
+        "entity_id": entity_id,
+        "name": attrs.get("friendly_name") or entity_id,
+        "domain": entity_id.split(".", 1)[0] if "." in entity_id else None,
+    }
+    area = attrs.get("area") or attrs.get("area_id") or attrs.get("room")
+    if area:
+        out["area"] = area
+    return out
+
+def project_action(action: Dict[str, Any]) -> Dict[str, Any]:
+    """Search hit or registry action -> {action, domain, service, fields} (no key/description)."""
+    return {
+        "action": action.get("action"),
+        "domain": action.get("domain"),
+        "service": action.get("service"),
+        "fields": list(action.get("fields") or []),
+    }
+
+class Bundle(BaseModel):
+    devices: List[Dict[str, Any]] = Field(default_factory=list)
+    actions: List[Dict[str, Any]] = Field(default_factory=list)
+    scores: Dict[str, float] = Field(default_factory=dict)  # retrieval score of kept candidates that had one
+    tokens: int = 0            # estimated tokens of the candidate JSON
+    dropped_devices: int = 0
+    dropped_actions: int = 0
+
+def build_bundle(
+    devices: List[Tuple[str, Dict[str, Any]]],
+    actions: List[Dict[str, Any]],
+    scores: Optional[Dict[str, float]] = None,
+    budget_tokens: int = BUNDLE_TOKEN_BUDGET,
+) -> Bundle:
+    """
+    Project, dedupe and trim retrieval output for the big LLM.
+
+    devices: [(entity_id, state)] in retrieval order; actions: search hits and
+    registry actions (may repeat). scores: {entity_id | "domain.service": score};
+    items without a score rank by position after scored ones. Lowest-ranked
+    candidates are dropped until the JSON fits budget_tokens (keeping at least
+    one device and one action).
+    """
+    scores = scores or {}
+    dev_items: List[Tuple[float, Dict[str, Any]]] = []
+    seen = set()
+    for i, (eid, state) in enumerate(devices):
+        if eid in seen:
+            continue
+        seen.add(eid)
+        dev_items.append((scores.get(eid, -1.0 - i * 1e-3), project_device(eid, state)))
+
+    act_items: List[Tuple[float, Dict[str, Any]]] = []
+    seen = set()
+    for i, a in enumerate(actions):
+        name = a.get("action")
+        if not name or name in seen:
+            continue
+        seen.add(name)
+        act_items.append((scores.get(name, -1.0 - i * 1e-3), project_action(a)))
+
+    dev_items.sort(key=lambda x: x[0], reverse=True)
+    act_items.sort(key=lambda x: x[0], reverse=True)
+    dev_cost = [estimate_tokens(_compact(d)) + 1 for _, d in dev_items]
+    act_cost = [estimate_tokens(_compact(a)) + 1 for _, a in act_items]
+    total = sum(dev_cost) + sum(act_cost)
+
+    n_dev, n_act = len(dev_items), len(act_items)
+    while total > budget_tokens and (n_dev > 1 or n_act > 1):
+        # drop whichever tail candidate has the lower score
+        drop_dev = n_act <= 1 or (n_dev > 1 and dev_items[n_dev - 1][0] <= act_items[n_act - 1][0])
+        if drop_dev:
+            n_dev -= 1
+            total -= dev_cost[n_dev]
+        else:
+            n_act -= 1
+            total -= act_cost[n_act]
+
+    kept_devices = [d for _, d in dev_items[:n_dev]]
+    kept_actions = [a for _, a in act_items[:n_act]]
+    keys = [d["entity_id"] for d in kept_devices] + [a["action"] for a in kept_actions]
+    return Bundle(
+        devices=kept_devices,
+        actions=kept_actions,
+        scores={k: scores[k] for k in keys if k in scores},
+        tokens=total,
+        dropped_devices=len(dev_items) - n_dev,
+        dropped_actions=len(act_items) - n_act,
+    )
@@ -0,0 +1,172 @@
+# core/decision_cache.py
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from core.big_llm import Decision
+
+DECISION_CACHE_ENABLED = os.getenv("DECISION_CACHE", "1").strip().lower() in ("1", "true", "yes", "on")
+DECISION_CACHE_TTL_S = float(os.getenv("DECISION_CACHE_TTL_S", "900"))
+DECISION_CACHE_MAX_ITEMS = int(os.getenv("DECISION_CACHE_MAX_ITEMS", "1024"))
+
+_PUNCT = re.compile(r"[^\w\s%.-]+")
+_SPACE = re.compile(r"\s+")
+# words that only make sense with the chat history ("turn it off", "do that again")
+_BACK_REFERENCE = re.compile(
+    r"\b(it|its|them|they|that|those|this|these|there|again|same|too|also|back|previous|last|other|one)\b"
+)
+
+def normalize_message(text: str) -> str:
+    """'Turn  ON the kitchen light!' -> 'turn on the kitchen light'."""
+    return _SPACE.sub(" ", _PUNCT.sub(" ", (text or "").lower())).strip(" .")
+
+def refers_back(message: str) -> bool:
+    """True when the message leans on earlier turns, so the history is part of its meaning."""
+    return bool(_BACK_REFERENCE.search(normalize_message(message)))
+
+def state_fingerprint(devices: Iterable[Tuple[str, Dict[str, Any]]]) -> str:
+    """Hash of the candidates' state + attributes: any change makes old decisions unreachable."""
+    parts = sorted(
+        (eid, (st or {}).get("state"), (st or {}).get("attributes") or {})
+        for eid, st in devices
+    )
+    blob = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+class _Entry:
+    __slots__ = ("raw", "decision", "entities", "expires_at")
+
+    def __init__(self, raw: str, decision: Decision, entities: Set[str], expires_at: float):
+        self.raw, self.decision, self.entities, self.expires_at = raw, decision, entities, expires_at
+
+class DecisionCache:
+    """
+    Big-LLM decisions keyed on (model, normalized message, context room, candidate
+    devices/actions, state fingerprint of those devices), plus the chat history only
+    for messages that refer back to it. TTL + LRU bounded; entries
+    are dropped as soon as one of their entities changes (see attach_to_mirror).
+    """
+    def __init__(self, ttl_s: float = DECISION_CACHE_TTL_S, max_items: int = DECISION_CACHE_MAX_ITEMS):
+        self.ttl_s = ttl_s
+        self.max_items = max_items
+        self._lru: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._by_entity: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(
+        model: str,
+        message: str,
+        context: Dict[str, Any],
+        devices: List[Tuple[str, Dict[str, Any]]],
+        device_ids: Iterable[str],
+        actions: Iterable[str],
+        recent: str = "",
+    ) -> str:
+        """
+        devices: [(entity_id, state)] to fingerprint; device_ids/actions: the candidate set
+        sent to the model; recent: the chat history in the prompt, keyed only when the
+        message refers back ("turn it off") so repeated commands hit in an ongoing chat.
+        """
+        parts = [
+            model,
+            normalize_message(message),
+            str((context or {}).get("room") or "").strip().lower(),
+            sorted(set(device_ids)),
+            sorted(set(actions)),
+            state_fingerprint(devices),
+            recent if refers_back(message) else "",
+        ]
+        blob = json.dumps(parts, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+    def _drop(self, key: str) -> None:
+        entry = self._lru.pop(key, None)
+        if entry is None:
+            return
+        for eid in entry.entities:
+            keys = self._by_entity.get(eid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_entity[eid]
+
+    def get(self, key: str) -> Optional[Tuple[str, Decision]]:
+        entry = self._lru.get(key)
+        if entry is not None and entry.expires_at < time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._lru.move_to_end(key)
+        self.hits += 1
+        return entry.raw, entry.decision
+
+    def put(self, key: str, raw: str, decision: Optional[Decision], entities: Iterable[str]) -> None:
+        if decision is None:
+            return  # never cache unparsable output
+        self._drop(key)
+        ents = set(entities)
+        self._lru[key] = _Entry(raw, decision, ents, time.monotonic() + self.ttl_s)
+        for eid in ents:
+            self._by_entity.setdefault(eid, set()).add(key)
+        while len(self._lru) > self.max_items:
+            self._drop(next(iter(self._lru)))
+            self.evictions += 1
+
+    def invalidate_entity(self, entity_id: str) -> int:
+        keys = list(self._by_entity.get(entity_id, ()))
+        for key in keys:
+            self._drop(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self, *_) -> None:
+        self._lru.clear()
+        self._by_entity.clear()
+
+    def on_state_changed(self, event: Dict[str, Any]) -> None:
+        entity_id = (event.get("data") or {}).get("entity_id")
+        if entity_id:
+            self.invalidate_entity(entity_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "items": len(self._lru),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+_CACHE: Optional[DecisionCache] = None
+
+def get_decision_cache() -> Optional[DecisionCache]:
+    """Process-wide cache, or None when DECISION_CACHE=0."""
+    global _CACHE
+    if not DECISION_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        _CACHE = DecisionCache()
+    return _CACHE
+
+def attach_to_mirror(mirror) -> None:
+    """Drop decisions touching an entity when it changes; clear after a reconnect (events may be missed)."""
+    cache = get_decision_cache()
+    if cache is None or mirror is None:
+        return
+    mirror.on_event("state_changed", cache.on_state_changed)
+    mirror.on_snapshot(cache.clear)
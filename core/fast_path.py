@@ -0,0 +1,224 @@
+# core/fast_path.py
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from ha.client import get_ha
+from ha.services import get_registry
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH", "1").strip().lower() in ("1", "true", "yes", "on")
+FAST_PATH_MIN_SCORE = float(os.getenv("FAST_PATH_MIN_SCORE", "0.8"))
+FAST_PATH_MIN_MARGIN = float(os.getenv("FAST_PATH_MIN_MARGIN", "0.15"))
+FAST_PATH_TTL_S = float(os.getenv("FAST_PATH_TTL_S", "60"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+# words that carry no device/action meaning in a direct command
+_STOP = {
+    "the", "a", "an", "my", "our", "please", "pls", "in", "on", "at", "of", "to", "for",
+    "can", "could", "would", "you", "will", "now", "and", "here", "room", "thanks",
+}
+
+# quantifiers: the command is meant for several devices, which the fast path never targets
+_MANY = {"all", "every", "everything", "both"}
+# plural in form, usually one device ("close the curtains")
+_PAIR_NOUNS = {"curtains", "blinds", "shades", "drapes"}
+# security-relevant domains always go through the LLM
+_EXCLUDED_DOMAINS = {"lock", "alarm_control_panel"}
+
+# spoken verb phrase -> HA service name (checked against the entity's domain)
+_VERBS: Dict[str, List[str]] = {
+    "turn on": ["turn_on"], "switch on": ["turn_on"], "power on": ["turn_on"], "enable": ["turn_on"],
+    "turn off": ["turn_off"], "switch off": ["turn_off"], "power off": ["turn_off"], "disable": ["turn_off"],
+    "toggle": ["toggle"],
+    "open": ["open_cover", "open_valve"], "close": ["close_cover", "close_valve"],
+    "start": ["start", "turn_on"], "stop": ["media_stop", "stop"], "pause": ["pause", "media_pause"],
+    "play": ["media_play"], "press": ["press"], "run": ["turn_on", "trigger"], "activate": ["turn_on"],
+}
+
+# generic nouns people use for a domain ("the light", "the blinds")
+_DOMAIN_NOUNS: Dict[str, Set[str]] = {
+    "light": {"light", "lights", "lamp", "lamps"},
+    "fan": {"fan", "fans"},
+    "cover": {"curtain", "curtains", "blind", "blinds", "shade", "shades", "cover", "garage"},
+    "switch": {"switch", "plug", "socket"},
+    "media_player": {"tv", "speaker", "music", "player"},
+    "vacuum": {"vacuum", "robot"},
+    "climate": {"heating", "ac", "thermostat", "heater"},
+}
+
+_REPLIES = {
+    "turn_on": "Turning on {name}.", "turn_off": "Turning off {name}.", "toggle": "Toggling {name}.",
+    "open_cover": "Opening {name}.", "close_cover": "Closing {name}.",
+    "open_valve": "Opening {name}.", "close_valve": "Closing {name}.",
+    "lock": "Locking {name}.", "unlock": "Unlocking {name}.",
+    "start": "Starting {name}.", "stop": "Stopping {name}.", "media_stop": "Stopping {name}.",
+    "press": "Pressing {name}.",
+}
+
+def reply_for(service: str, name: str) -> str:
+    """Short confirmation for `service` on a device called `name`."""
+    return _REPLIES.get(service, "Done: {action} on {name}.").format(name=name, action=service)
+
+def _tokens(text: str) -> List[str]:
+    return _WORD.findall((text or "").lower().replace("_", " "))
+
+def _singular(tok: str) -> str:
+    return tok[:-1] if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss") else tok
+
+_NOUNS = {_singular(n) for nouns in _DOMAIN_NOUNS.values() for n in nouns}
+
+def _plural_noun(tok: str) -> bool:
+    return tok not in _PAIR_NOUNS and _singular(tok) != tok and _singular(tok) in _NOUNS
+
+class FastPathMatch(BaseModel):
+    device: str
+    action: str
+    reply: str
+    score: float
+
+class _Entry:
+    __slots__ = ("entity_id", "domain", "name", "tokens", "area")
+
+    def __init__(self, entity_id: str, domain: str, name: str, tokens: Set[str], area: Set[str]):
+        self.entity_id, self.domain, self.name, self.tokens, self.area = entity_id, domain, name, tokens, area
+
+class FastPath:
+    """
+    Deterministic resolver for plain commands ("turn off the kitchen light").
+
+    Verb phrases map to HA service names; the remaining words are matched against
+    an index of friendly names, areas, aliases and generic domain nouns. A match
+    is returned only when exactly one device and one service clear
+    FAST_PATH_MIN_SCORE with FAST_PATH_MIN_MARGIN over the runner-up; anything
+    else (numbers, unknown words, ties, "all"/plural targets, locks and alarms)
+    falls through to the LLM pipeline.
+    """
+    def __init__(
+        self,
+        min_score: float = FAST_PATH_MIN_SCORE,
+        min_margin: float = FAST_PATH_MIN_MARGIN,
+        aliases: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.aliases = aliases or {}   # entity_id -> extra names (Device.aliases)
+        self._entries: List[_Entry] = []
+        self._services: Dict[str, Set[str]] = {}
+        self._built_at = 0.0
+        self._registry_version = -1
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- index ----------
+    def build(self, states: Iterable[Dict[str, Any]], services_map: Dict[str, Dict[str, Any]]) -> None:
+        entries: List[_Entry] = []
+        for st in states:
+            eid = st.get("entity_id") or ""
+            if "." not in eid:
+                continue
+            domain, obj = eid.split(".", 1)
+            if domain in _EXCLUDED_DOMAINS:
+                continue
+            attrs = st.get("attributes") or {}
+            name = attrs.get("friendly_name") or obj.replace("_", " ")
+            area = {_singular(t) for t in _tokens(attrs.get("area") or attrs.get("area_id") or attrs.get("room") or "")}
+            toks = {_singular(t) for t in _tokens(name) + _tokens(obj)}
+            for alias in self.aliases.get(eid, []):
+                toks |= {_singular(t) for t in _tokens(alias)}
+            toks |= {_singular(t) for t in _DOMAIN_NOUNS.get(domain, ())}
+            toks |= area
+            entries.append(_Entry(eid, domain, name, toks - _STOP, area))
+        self._entries = entries
+        self._services = {d: set(svcs.keys()) for d, svcs in (services_map or {}).items()}
+        self._built_at = time.time()
+
+    async def refresh(self, force: bool = False) -> None:
+        registry = get_registry()
+        services_map = await registry.services_map()
+        stale = (time.time() - self._built_at) > FAST_PATH_TTL_S
+        if force or stale or registry.version != self._registry_version:
+            self.build(await get_ha().states(), services_map)
+            self._registry_version = registry.version
+
+    # ---------- matching ----------
+    @staticmethod
+    def _split_verb(tokens: List[str]) -> Tuple[Optional[str], List[str]]:
+        text = " ".join(tokens)
+        for phrase in sorted(_VERBS, key=len, reverse=True):
+            m = re.search(rf"\b{re.escape(phrase)}\b", text)
+            if m:
+                rest = (text[:m.start()] + " " + text[m.end():]).split()
+                return phrase, rest
+        return None, tokens
+
+    def match(self, message: str, context: Optional[Dict[str, Any]] = None) -> Optional[FastPathMatch]:
+        tokens = _tokens(message)
+        if not tokens or any(t.isdigit() for t in tokens):
+            return None  # values/args ("to 50%") need the LLM
+        verb, rest = self._split_verb(tokens)
+        if verb is None:
+            return None
+        if any(t in _MANY or _plural_noun(t) for t in rest):
+            return None  # several devices ("all the lights", "the fans")
+        words = {_singular(t) for t in rest} - _STOP
+        if not words:
+            return None
+        room = {_singular(t) for t in _tokens(str((context or {}).get("room") or ""))}
+
+        scored: List[Tuple[float, _Entry, str]] = []
+        for e in self._entries:
+            service = next((s for s in _VERBS[verb] if s in self._services.get(e.domain, ())), None)
+            if service is None:
+                continue
+            covered = len(words & e.tokens) / len(words)
+            if covered < 1.0:
+                continue  # every content word must be explained by this entity
+            score = covered
+            # prefer specific names over generic domain nouns, and the caller's room when none was said
+            score += 0.1 * len(words & (e.tokens - _DOMAIN_NOUNS.get(e.domain, set())))
+            if room and not (words & e.area) and (room & e.tokens):
+                score += 0.2
+            scored.append((score, e, service))
+        if not scored:
+            return None
+        scored.sort(key=lambda x: x[0], reverse=True)
+        best_score, best, service = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else float("-inf")
+        if best_score < self.min_score or (best_score - runner_up) < self.min_margin:
+            return None
+        reply = reply_for(service, best.name)
+        return FastPathMatch(device=best.entity_id, action=f"{best.domain}.{service}", reply=reply, score=round(best_score, 3))
+
+    async def resolve(self, message: str, context: Optional[Dict[str, Any]] = None) -> Optional[FastPathMatch]:
+        """match() on a fresh index, counting hits/misses."""
+        await self.refresh()
+        m = self.match(message, context)
+        if m is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return m
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "entities_indexed": len(self._entries),
+        }
+
+_FAST_PATH: Optional[FastPath] = None
+
+def get_fast_path() -> Optional[FastPath]:
+    """Process-wide resolver, or None when FAST_PATH=0."""
+    global _FAST_PATH
+    if not FAST_PATH_ENABLED:
+        return None
+    if _FAST_PATH is None:
+        _FAST_PATH = FastPath()
+    return _FAST_PATH
@@ -1,24 +1,52 @@
 # core/history.py
+import asyncio
 import json
+import os
+from typing import Any, Dict, List, Optional
 
-def compact_recent() -> str:
-    history = {
-        "messages": [
-            {"role":"user","text":"hi"},
-            {"role":"assistant","text":"hello, what can I do?"},
-            {"role":"user","text":"lights were too bright this morning"},
-            {"role":"assistant","text":"we can dim them next time"},
-            {"role":"user","text":"bedroom felt cold last night"},
-            {"role":"assistant","text":"we can set temp to 21C at night"},
-        ],
-        "memory": {  # fake memory
-            "lighting_pref":"softer mornings",
-            "temp_pref":"21–22C in bedroom at night",
-            "mood":"often tired in evenings",
-        },
-        "executions": [  # actions previously executed by the LLM
-            {"service":"light.turn_on","device":"light.living_room_main","args":{},"result":"ok"},
-            {"service":"climate.set_temperature","device":"climate.bedroom","args":{"temperature":21},"result":"ok"},
-        ],
-    }
-    return json.dumps(history, ensure_ascii=False, separators=(",",":"))
+from core.bundle import estimate_tokens
+from data.message_log import get_message_log
+
+# token budget for the recent-history JSON handed to the LLM
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "400"))
+# how long a turn waits for a cold chat's history to load before going without it
+HISTORY_READ_TIMEOUT_MS = float(os.getenv("HISTORY_READ_TIMEOUT_MS", "200"))
+
+def _compact(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def compact_history(messages: List[Dict[str, Any]], summary: str = "", max_tokens: int = HISTORY_TOKEN_BUDGET) -> str:
+    """
+    {"summary": "...", "messages": [{"role","text"}, ...]} with the newest
+    messages that fit max_tokens (summary counted first), oldest first.
+    """
+    used = estimate_tokens(_compact({"summary": summary, "messages": []}))
+    kept: List[Dict[str, str]] = []
+    for m in reversed(messages):
+        item = {"role": m["role"], "text": m["content"]}
+        cost = estimate_tokens(_compact(item)) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(item)
+        used += cost
+    kept.reverse()
+    return _compact({"summary": summary, "messages": kept})
+
+async def compact_recent(
+    chat_id: Optional[str] = None, max_tokens: int = HISTORY_TOKEN_BUDGET, timeout_ms: float = HISTORY_READ_TIMEOUT_MS,
+) -> str:
+    """
+    Token-bounded history of a chat from the message log, "" if it has none.
+    A chat not in memory yet is loaded, waiting at most timeout_ms.
+    """
+    if not chat_id:
+        return ""
+    log = get_message_log()
+    try:
+        await asyncio.wait_for(log.recent(chat_id), timeout_ms / 1000)
+    except asyncio.TimeoutError:
+        pass  # the load carries on in the background for the next turn
+    messages, summary = log.peek(chat_id)
+    if not messages and not summary:
+        return ""
+    return compact_history(messages, summary, max_tokens)
@@ -2,10 +2,13 @@
 import os
 import json
 import re
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+from pydantic import BaseModel
 from core.llm_client import OllamaClient
 
 SMALL_MODEL = os.getenv("SMALL_MODEL", "qwen2.5:3b-instruct")
+# most commands taken from one message ("... and ..."); 1 turns decomposition off
+MULTI_COMMAND_MAX = int(os.getenv("MULTI_COMMAND_MAX", "4"))
 SYSTEM = (
     "You guess the user's smart-home action using short keywords.\n"
     "ALWAYS return ONE LINE JSON with exactly these keys:\n"
@@ -17,21 +20,116 @@ SYSTEM = (
     "- Use verbs/nouns for service (turn_on, dim, set_temp, open_curtain, fan_speed, etc.).\n"
     "- No prose, no extra keys, one line only.\n\n"
 )
+# Ollama `format` constraint matching SYSTEM
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string"},
+        "target": {"type": "string"},
+        "service": {"type": "string"},
+    },
+    "required": ["intent", "target", "service"],
+}
+
+# Multi-command variant, used only when the message looks like it holds several commands
+COMMANDS_SYSTEM = (
+    "You split a smart-home message into its separate commands and guess each one using short keywords.\n"
+    "ALWAYS return ONE LINE JSON:\n"
+    '{"commands":[{"text":"<the command on its own>","intent":"<what action>","target":"<what/where>","service":"<how/function>"}]}\n'
+    "Rules:\n"
+    "- One entry per command; a single command gives a list of one.\n"
+    "- text: that command as a standalone sentence, with shared words filled in "
+    "(\"turn off the lamp and the fan\" -> \"turn off the lamp\", \"turn off the fan\").\n"
+    "- Keep intent/target/service to a short phrase (≤6 words); if uncertain, still guess.\n"
+    "- No prose, no extra keys, one line only.\n\n"
+)
+COMMANDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "commands": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "text": {"type": "string"},
+                    "intent": {"type": "string"},
+                    "target": {"type": "string"},
+                    "service": {"type": "string"},
+                },
+                "required": ["text", "intent", "target", "service"],
+            },
+        },
+    },
+    "required": ["commands"],
+}
+
+class Intent(BaseModel):
+    intent: str = ""
+    target: str = ""
+    service: str = ""
+    text: str = ""   # the sub-command on its own (multi-command extraction only)
+
+    def keywords(self) -> str:
+        """One-line JSON in extract_intents' format, for retrieval and routing."""
+        return json.dumps(
+            self.model_dump(include={"intent", "target", "service"}), ensure_ascii=False, separators=(",", ":"),
+        )
+
+# Cheap gate: several commands means a command verb on at least two sides of a
+# conjunction/separator. "turn off the lamp and the fan" (one verb) stays a single
+# command and may target several devices; "black and white lamp" has no verb at all.
+_SEPARATOR = re.compile(r"[,;&+]|\b(?:and|then|also|plus|as well as)\b", re.IGNORECASE)
+_COMMAND_VERBS = {
+    "turn", "switch", "power", "shut", "set", "dim", "brighten", "open", "close", "lock", "unlock",
+    "start", "stop", "pause", "play", "resume", "toggle", "enable", "disable", "activate", "run",
+    "raise", "lower", "increase", "decrease", "mute", "unmute", "arm", "disarm", "adjust", "change",
+}
+_WORD = re.compile(r"[a-z]+")
+
+def maybe_multi(message: str) -> bool:
+    if MULTI_COMMAND_MAX < 2:
+        return False
+    parts = _SEPARATOR.split(message.lower())
+    return sum(1 for p in parts if _COMMAND_VERBS & set(_WORD.findall(p))) >= 2
+
 # Strip bidi/control chars that can confuse the model (e.g., \u200E seen in logs)
 _CTRL = re.compile(r'[\u200E\u200F\u202A-\u202E\u2066-\u2069]')
 
 def _clean(s: str) -> str:
     return _CTRL.sub('', s)
 
+async def _run(message: str, context: Dict[str, Any], system: str = SYSTEM, schema: Dict[str, Any] = SCHEMA):
+    ctx_txt = _clean(json.dumps(context, ensure_ascii=False, separators=(",", ":")))
+    msg_txt = _clean(message)
+    user = f"Context:{ctx_txt}\nUser:{msg_txt}"
+    return await OllamaClient().chat_json(system, [{"role": "user", "content": user}], model=SMALL_MODEL, schema=schema)
+
+def _intent(obj: Any) -> Optional[Intent]:
+    if not isinstance(obj, dict):
+        return None
+    return Intent(**{k: str(v) for k, v in obj.items() if k in Intent.model_fields})
+
 async def extract_intents(message: str, context: Dict[str, Any]) -> str:
     """
     Call the small LLM and return its RAW one-line output as text.
-    - No JSON parsing.
+    - Output is schema-constrained and cut off when the JSON object closes.
     - No post-processing or fallback.
     - We only clean control/bidi chars from inputs to avoid {} outputs.
     """
-    ctx_txt = _clean(json.dumps(context, ensure_ascii=False, separators=(",", ":")))
-    msg_txt = _clean(message)
-    user = f"Context:{ctx_txt}\nUser:{msg_txt}"
-    out = await OllamaClient().chat(SYSTEM, [{"role": "user", "content": user}], model=SMALL_MODEL)
-    return out.strip() if isinstance(out, str) else str(out)
+    _, raw = await _run(message, context)
+    return raw
+
+async def extract_intent(message: str, context: Dict[str, Any]) -> Optional[Intent]:
+    """Typed variant of extract_intents (None if the model produced no usable object)."""
+    obj, _ = await _run(message, context)
+    return _intent(obj)
+
+async def extract_commands(message: str, context: Dict[str, Any]) -> List[Intent]:
+    """
+    Split a message into its commands (at most MULTI_COMMAND_MAX), each with its
+    own standalone text and keywords. Empty if the model produced nothing usable.
+    """
+    obj, _ = await _run(message, context, COMMANDS_SYSTEM, COMMANDS_SCHEMA)
+    items = obj.get("commands") if isinstance(obj, dict) else None
+    intents = [i for i in map(_intent, items or []) if i is not None and (i.text or i.target)]
+    return intents[:max(MULTI_COMMAND_MAX, 1)]
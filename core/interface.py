@@ -1,58 +1,445 @@
 # core/interface.py
-from typing import Any, Dict
+import asyncio
+import json
+import os
+import time
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Tuple
 from core.history import compact_recent
-from core.intent_extractor import extract_intents
-from core.big_llm import run_big_llm
-from data.search_devices import search_devices
-from data.search_actions import search_actions
-from ha.client import HAClient
+from core.intent_extractor import SMALL_MODEL, Intent, extract_commands, extract_intents, maybe_multi
+from core.big_llm import Decision, run_big_llm, stream_big_llm
+from core.bundle import Bundle, build_bundle
+from core.decision_cache import get_decision_cache
+from core.fast_path import FastPathMatch, get_fast_path
+from core.llm_client import BIG_MODEL, EMBED_MODEL, PRIORITY_BACKGROUND
+from core.router import RouteDecision, get_router
+from data.embedding import embed_texts
+from data.search_devices import resolve_device_hits
+from data.search_actions import resolve_action_hits
+from data.vectors_devices import query as query_devices
+from data.vectors_actions import query as query_actions
+from ha.services import get_registry
+from utils.jsonio import JsonStreamParser, parse_one_line_json
+
+Hits = List[Tuple[str, float]]
+
+# Speculative retrieval: search the raw message while the small LLM runs.
+SPECULATIVE = os.getenv("SPECULATIVE_RETRIEVAL", "0").strip().lower() in ("1", "true", "yes", "on")
+# ...and skip the small LLM when the raw-message device hit is this clear (cosine similarity)
+SKIP_SMALL_LLM = os.getenv("SKIP_SMALL_LLM", "0").strip().lower() in ("1", "true", "yes", "on")
+SKIP_MIN_SCORE = float(os.getenv("SKIP_SMALL_LLM_MIN_SCORE", "0.75"))
+SKIP_MIN_MARGIN = float(os.getenv("SKIP_SMALL_LLM_MIN_MARGIN", "0.08"))
+
+def _confident(hits: Hits, min_score: float, min_margin: float) -> bool:
+    """Top-1 hit is strong and clearly ahead of top-2."""
+    if not hits:
+        return False
+    top1 = hits[0][1]
+    top2 = hits[1][1] if len(hits) > 1 else float("-inf")
+    return top1 >= min_score and (top1 - top2) >= min_margin
+
+def _merge_hits(a: Hits, b: Hits, top_k: int) -> Hits:
+    """Union by key (best score wins), best first, capped at top_k."""
+    best: Dict[str, float] = {}
+    for key, score in a + b:
+        if key not in best or score > best[key]:
+            best[key] = score
+    return sorted(best.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
 
 
 class Interface:
     """
     Orchestrates one user turn:
-    user_message -> small keywords -> search devices/actions -> big LLM
+    user_message -> small keywords -> embed once -> search devices/actions (concurrently) -> big LLM
+
+    speculative=True starts embedding + searching the raw message alongside the
+    small LLM; keyword hits are merged in only if they add candidates.
+    skip_small_llm=True additionally cancels the small LLM when the raw-message
+    device hit is confident (see SKIP_SMALL_LLM_MIN_SCORE / _MIN_MARGIN).
+
+    A message holding several commands ("... and ...") is split by the small LLM
+    first; each command then runs the whole pipeline concurrently and the
+    decisions come back together with one combined reply.
     """
-    def __init__(self, top_k: int = 6, big_model: str = "llama3.1:latest"):
+    def __init__(
+        self,
+        top_k: int = 6,
+        big_model: str = BIG_MODEL,
+        embed_model: str = EMBED_MODEL,
+        speculative: bool = SPECULATIVE,
+        skip_small_llm: bool = SKIP_SMALL_LLM,
+    ):
         self.top_k = top_k
         self.big_model = big_model
+        self.embed_model = embed_model
+        self.speculative = speculative
+        self.skip_small_llm = skip_small_llm
+        self.fast_path = get_fast_path()
+        self.decision_cache = get_decision_cache()
+        self.router = get_router()
+        # speculative outcomes: small LLM skipped / keywords added nothing / both sets merged
+        self.stats = {"skipped": 0, "raw_only": 0, "merged": 0}
 
-    async def handle_message(self, user_message: str, context: Dict[str, Any]) -> Dict[str, Any]:
-        recent = compact_recent()
-        keywords = await extract_intents(user_message, context)
-        qtext = keywords or user_message
+    async def _hits(self, text: str) -> Tuple[Hits, Hits]:
+        """Embed once, query both indexes side by side -> (device_hits, action_hits)."""
+        qvec = (await embed_texts([text], model=self.embed_model))[0]
+        dev, act = await asyncio.gather(
+            asyncio.to_thread(query_devices, qvec, self.top_k),
+            asyncio.to_thread(query_actions, qvec, self.top_k),
+        )
+        return dev or [], act or []
 
-        devices = await search_devices(qtext, top_k=self.top_k)
-        actions = await search_actions(qtext, top_k=self.top_k)
-        ha = HAClient()
+    async def _speculative_hits(self, user_message: str, context: Dict[str, Any]) -> Tuple[str, Hits, Hits]:
+        intent_task = asyncio.create_task(extract_intents(user_message, context))
+        try:
+            raw_dev, raw_act = await self._hits(user_message)
+        except BaseException:
+            intent_task.cancel()
+            raise
+        if self.skip_small_llm and _confident(raw_dev, SKIP_MIN_SCORE, SKIP_MIN_MARGIN):
+            intent_task.cancel()
+            self.stats["skipped"] += 1
+            return "", raw_dev, raw_act
+
+        keywords = await intent_task
+        if not keywords:
+            self.stats["raw_only"] += 1
+            return keywords, raw_dev, raw_act
+        kw_dev, kw_act = await self._hits(keywords)
+        raw_keys = {k for k, _ in raw_dev + raw_act}
+        if all(k in raw_keys for k, _ in kw_dev + kw_act):
+            self.stats["raw_only"] += 1
+            return keywords, raw_dev, raw_act
+        self.stats["merged"] += 1
+        return keywords, _merge_hits(raw_dev, kw_dev, self.top_k), _merge_hits(raw_act, kw_act, self.top_k)
+
+    async def retrieve(
+        self, user_message: str, context: Dict[str, Any], keywords: str | None = None,
+    ) -> Tuple[str, List[Any], List[Dict[str, Any]], Dict[str, float]]:
+        """
+        Small LLM keywords + device/action retrieval -> (keywords, devices, actions, scores).
+        Keywords already extracted (a split-off command) skip the small LLM.
+        """
+        if keywords is not None:
+            dev_hits, act_hits = await self._hits(keywords or user_message)
+        elif self.speculative:
+            keywords, dev_hits, act_hits = await self._speculative_hits(user_message, context)
+        else:
+            keywords = await extract_intents(user_message, context)
+            dev_hits, act_hits = await self._hits(keywords or user_message)
+
+        registry = get_registry()
+        # HA state resolution, action field lookup, and service registry overlap
+        devices, actions, _ = await asyncio.gather(
+            resolve_device_hits(dev_hits),
+            resolve_action_hits(act_hits),
+            registry.services_map(),
+        )
         domains = sorted({
             key.split(".", 1)[0] for key, state in devices if isinstance(key, str) and "." in key
         })
         for domain in domains:
-            svcs = await ha.domain_services(domain)
-            for svc, schema in (svcs or {}).items():
-                actions.append({
-                    "action": f"{domain}.{svc}",
-                    "domain": domain,
-                    "service": svc,
-                    "fields": list((schema.get("fields") or {}).keys()),
-                    "description": schema.get("description") or ""
-                })
-
-        decision = await run_big_llm(
-            user_message=user_message,
-            context=context,
-            # recent_json=recent,
-            # keywords_text=keywords,
-            devices=devices,
-            actions=actions,
-            model=self.big_model,
+            actions.extend(await registry.domain_actions(domain))
+
+        # {entity_id | "domain.service": score}; domain-expanded services rank just below their best device
+        scores = {k.split(":", 1)[1]: s for k, s in dev_hits + act_hits if ":" in k}
+        best_by_domain: Dict[str, float] = {}
+        for eid, _ in devices:
+            dom = eid.split(".", 1)[0]
+            best_by_domain[dom] = max(best_by_domain.get(dom, float("-inf")), scores.get(eid, 0.0))
+        for a in actions:
+            if a.get("action") not in scores and a.get("domain") in best_by_domain:
+                scores[a["action"]] = best_by_domain[a["domain"]] - 0.05
+        return keywords, devices, actions, scores
+
+    async def _bundle(
+        self, user_message: str, context: Dict[str, Any], keywords: str | None = None, chat_id: str | None = None,
+    ) -> Tuple[str, Bundle, str | None, str]:
+        """-> (keywords, bundle, decision-cache key or None, chat history JSON or "")."""
+        # a cold chat's history loads while retrieval runs
+        (keywords, devices, actions, scores), recent = await asyncio.gather(
+            self.retrieve(user_message, context, keywords), compact_recent(chat_id),
         )
+        bundle = build_bundle(devices, actions, scores)
+        key = None
+        if self.decision_cache is not None:
+            ids = [d["entity_id"] for d in bundle.devices]
+            kept = set(ids)
+            key = self.decision_cache.key(
+                self.big_model, user_message, context,
+                [(eid, st) for eid, st in devices if eid in kept],
+                ids, [a["action"] for a in bundle.actions], recent,
+            )
+        return keywords, bundle, key, recent
+
+    def _cached(self, key: str | None) -> Tuple[str, Decision] | None:
+        return self.decision_cache.get(key) if key is not None else None
+
+    def _store(self, key: str | None, raw: str, decision: Decision | None, bundle: Bundle, plan: RouteDecision) -> None:
+        # keys are built for the big model; direct/small answers are cheap to redo and must
+        # not be served later as big-model decisions
+        if key is not None and plan.route == "big":
+            self.decision_cache.put(key, raw, decision, [d["entity_id"] for d in bundle.devices])
+
+    async def _fast(self, user_message: str, context: Dict[str, Any]) -> FastPathMatch | None:
+        if self.fast_path is None:
+            return None
+        try:
+            return await self.fast_path.resolve(user_message, context)
+        except Exception as e:
+            # never let the shortcut break a turn; the LLM pipeline still works
+            print(f"[fast-path] error: {type(e).__name__}: {e}")
+            return None
+
+    @staticmethod
+    def _fast_decision(m: FastPathMatch) -> Decision:
+        return Decision(mode="EXECUTE", device=m.device, action=m.action, args={}, reply=m.reply)
+
+    async def _split(self, user_message: str, context: Dict[str, Any]) -> Tuple[str | None, List[Intent]]:
+        """
+        -> (keywords, commands). Only messages that may hold several commands are
+        split; a single command found that way comes back as ready keywords.
+        """
+        if not maybe_multi(user_message):
+            return None, []
+        commands = await extract_commands(user_message, context)
+        if len(commands) == 1:
+            return commands[0].keywords(), []
+        return None, commands
+
+    @staticmethod
+    def _combine(decisions: List[Decision]) -> Decision | None:
+        """One decision standing for several: the replies joined, EXECUTE if any part executes."""
+        if not decisions:
+            return None
+        replies = list(dict.fromkeys(d.reply_text for d in decisions if d.reply_text))
+        mode = "EXECUTE" if any(d.is_execute for d in decisions) else "REPLY"
+        return Decision(mode=mode, reply=" ".join(replies) or None)
+
+    def _route(self, bundle: Bundle, context: Dict[str, Any], keywords: str) -> RouteDecision:
+        if self.router is None:
+            return RouteDecision(route="big")
+        plan = self.router.route(bundle, context, parse_one_line_json(keywords) if keywords else None)
+        print(f"[router] {plan.route} (top {plan.confidence:.3f}, margin {plan.margin:.3f})")
+        return plan
+
+    def _model_for(self, plan: RouteDecision) -> str:
+        return SMALL_MODEL if plan.route == "small" else self.big_model
+
+    def _routed(
+        self, plan: RouteDecision, t0: float, parsed: Decision | None,
+        user_message: str, context: Dict[str, Any], bundle: Bundle, recent: str = "",
+    ) -> None:
+        """Per-route latency, plus a sampled background big-model check of cheap routes."""
+        if self.router is None:
+            return
+        self.router.record(plan.route, (time.perf_counter() - t0) * 1000)
+
+        async def reference() -> Decision | None:
+            raw = await run_big_llm(
+                user_message=user_message, context=context, devices=bundle.devices, actions=bundle.actions,
+                model=self.big_model, priority=PRIORITY_BACKGROUND, recent_json=recent,
+            )
+            return Decision.from_obj(parse_one_line_json(raw))
+
+        self.router.maybe_shadow(plan.route, parsed, reference())
+
+    @staticmethod
+    def _instant_events(decision: Decision, raw: str, keywords: str) -> List[Dict[str, Any]]:
+        """stream_message events for a decision that is already known."""
+        events: List[Dict[str, Any]] = []
+        if decision.is_execute:
+            events.append({"type": "execute", "device": decision.device, "action": decision.action, "args": decision.args})
+        if decision.reply_text:
+            events.append({"type": "delta", "text": decision.reply_text})
+        events.append({"type": "decision", "decision": decision, "raw": raw, "keywords": keywords})
+        return events
+
+    def _fast_result(self, user_message: str, context: Dict[str, Any], fast: FastPathMatch) -> Dict[str, Any]:
+        decision = self._fast_decision(fast)
+        return {
+            "message": user_message,
+            "context": context,
+            "keywords": "",
+            "devices": [],
+            "actions": [],
+            "decision": json.dumps(decision.model_dump(exclude_none=True), ensure_ascii=False),
+            "parsed": decision,
+            "decisions": [decision],
+            "fast_path": True,
+        }
+
+    async def handle_message(self, user_message: str, context: Dict[str, Any], chat_id: str | None = None) -> Dict[str, Any]:
+        """
+        -> {"parsed": Decision | None, "decisions": [Decision, ...], ...}; "decisions"
+        holds one entry per command (several when the message was split).
+        """
+        fast = await self._fast(user_message, context)
+        if fast is not None:
+            return self._fast_result(user_message, context, fast)
+        keywords, commands = await self._split(user_message, context)
+        if commands:
+            return await self._handle_commands(user_message, context, commands)
+        return await self._decide(user_message, context, chat_id, keywords)
+
+    async def _handle_command(self, command: Intent, context: Dict[str, Any]) -> Dict[str, Any]:
+        text = command.text or f"{command.intent} {command.target}"
+        fast = await self._fast(text, context)
+        if fast is not None:
+            return self._fast_result(text, context, fast)
+        # chat_id stays out: the parts would race for the chat's carried context
+        return await self._decide(text, context, None, command.keywords())
+
+    async def _handle_commands(self, user_message: str, context: Dict[str, Any], commands: List[Intent]) -> Dict[str, Any]:
+        """Resolve and decide every command concurrently; the turn takes as long as the slowest."""
+        parts = await asyncio.gather(*(self._handle_command(c, context) for c in commands))
+        decisions = [p["parsed"] for p in parts if p["parsed"] is not None]
+        print(f"[multi] {len(parts)} commands: " + ", ".join(
+            f"{p['message']!r} -> {p['parsed'].mode if p['parsed'] else None}" for p in parts
+        ))
+        return {
+            "message": user_message,
+            "context": context,
+            "keywords": "\n".join(p["keywords"] for p in parts),
+            "devices": [d for p in parts for d in p["devices"]],
+            "actions": [a for p in parts for a in p["actions"]],
+            "bundle_tokens": sum(p.get("bundle_tokens", 0) for p in parts),
+            "decision": "\n".join(p["decision"] for p in parts),
+            "parsed": self._combine(decisions),
+            "decisions": decisions,
+            "fast_path": all(p["fast_path"] for p in parts),
+            "cached": all(p.get("cached", False) for p in parts),
+            "route": [p.get("route") for p in parts],
+            "parts": parts,
+        }
+
+    async def _decide(
+        self, user_message: str, context: Dict[str, Any], chat_id: str | None, keywords: str | None = None,
+    ) -> Dict[str, Any]:
+        keywords, bundle, key, recent = await self._bundle(user_message, context, keywords, chat_id)
+
+        cached = self._cached(key)
+        plan = None
+        if cached is not None:
+            decision, parsed = cached
+        else:
+            t0 = time.perf_counter()
+            plan = self._route(bundle, context, keywords)
+            parsed = plan.decision()
+            if parsed is not None:
+                decision = json.dumps(parsed.model_dump(exclude_none=True), ensure_ascii=False)
+            else:
+                decision = await run_big_llm(
+                    user_message=user_message,
+                    context=context,
+                    devices=bundle.devices,
+                    actions=bundle.actions,
+                    model=self._model_for(plan),
+                    recent_json=recent,
+                )
+                parsed = Decision.from_obj(parse_one_line_json(decision))
+            self._routed(plan, t0, parsed, user_message, context, bundle, recent)
+            self._store(key, decision, parsed, bundle, plan)
         return {
             "message": user_message,
             "context": context,
             "keywords": keywords,
-            "devices": devices,
-            "actions": actions,
+            "devices": bundle.devices,
+            "actions": bundle.actions,
+            "bundle_tokens": bundle.tokens,
+            "decision": decision,
+            "parsed": parsed,
+            "decisions": [parsed] if parsed is not None else [],
+            "fast_path": False,
+            "cached": cached is not None,
+            "route": plan.route if plan is not None else None,
+        }
+
+    async def stream_message(
+        self, user_message: str, context: Dict[str, Any], chat_id: str | None = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming handle_message. Yields, in order of availability:
+          {"type":"delta","text":...}    reply text ("reply"/"text" field) as it is generated
+          {"type":"execute","device":...,"action":...,"args":{...}}
+                                         once an EXECUTE decision has all of its target fields
+          {"type":"decision","decision":Decision|None,"raw":"...","keywords":...}   at the end
+        Generation stops as soon as the decision object closes. Fast-path and
+        decision-cache hits skip the (big) LLM and yield the same events at once.
+        A message split into several commands is decided without streaming; its
+        executions arrive together as {"type":"execute","commands":[{device,action,args}, ...]}
+        and the decision event also carries "decisions".
+        """
+        fast = await self._fast(user_message, context)
+        if fast is not None:
+            for ev in self._instant_events(self._fast_decision(fast), "", ""):
+                yield ev
+            return
+
+        keywords, commands = await self._split(user_message, context)
+        if commands:
+            result = await self._handle_commands(user_message, context, commands)
+            decisions = result["decisions"]
+            execs = [{"device": d.device, "action": d.action, "args": d.args} for d in decisions if d.is_execute]
+            if execs:
+                yield {"type": "execute", "commands": execs}
+            combined = result["parsed"]
+            if combined is not None and combined.reply_text:
+                yield {"type": "delta", "text": combined.reply_text}
+            yield {
+                "type": "decision",
+                "decision": combined,
+                "decisions": decisions,
+                "raw": result["decision"],
+                "keywords": result["keywords"],
+            }
+            return
+
+        keywords, bundle, key, recent = await self._bundle(user_message, context, keywords, chat_id)
+        cached = self._cached(key)
+        if cached is not None:
+            for ev in self._instant_events(cached[1], cached[0], keywords):
+                yield ev
+            return
+        t0 = time.perf_counter()
+        plan = self._route(bundle, context, keywords)
+        direct = plan.decision()
+        if direct is not None:
+            raw = json.dumps(direct.model_dump(exclude_none=True), ensure_ascii=False)
+            self._routed(plan, t0, direct, user_message, context, bundle, recent)
+            self._store(key, raw, direct, bundle, plan)
+            for ev in self._instant_events(direct, raw, keywords):
+                yield ev
+            return
+        parser = JsonStreamParser(stream_keys=("reply", "text"))
+        execute_sent = False
+        stream = stream_big_llm(
+            user_message=user_message,
+            context=context,
+            devices=bundle.devices,
+            actions=bundle.actions,
+            model=self._model_for(plan),
+            recent_json=recent,
+        )
+        async with aclosing(stream):
+            async for piece in stream:
+                events = parser.feed(piece)
+                delta = "".join(value for kind, _, value in events if kind == "delta")
+                if delta:
+                    yield {"type": "delta", "text": delta}
+                f = parser.fields
+                if not execute_sent and f.get("mode") == "EXECUTE" and all(k in f for k in ("device", "action", "args")):
+                    execute_sent = True
+                    yield {"type": "execute", "device": f["device"], "action": f["action"], "args": f["args"]}
+                if parser.done:
+                    break
+        decision = Decision.from_obj(parser.obj)
+        self._routed(plan, t0, decision, user_message, context, bundle, recent)
+        if parser.done:
+            self._store(key, parser.text.strip(), decision, bundle, plan)
+        yield {
+            "type": "decision",
             "decision": decision,
+            "raw": parser.text.strip(),
+            "keywords": keywords,
         }
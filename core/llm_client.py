@@ -1,12 +1,214 @@
 # core/llm_client.py
 
-import time, httpx, os
+import asyncio, hashlib, heapq, itertools, json, time, httpx, os
+from collections import deque
+from contextlib import aclosing, asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from utils.jsonio import JsonStreamParser
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+BIG_MODEL = os.getenv("BIG_MODEL", "llama3.1:latest")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+# how long Ollama keeps a model loaded after a request ("30m", "-1" = forever)
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# ONE context size per model: Ollama reloads the runner whenever num_ctx changes, so
+# every request to a model (warm-up, interactive, background) must send the same value.
+# LLM_NUM_CTX is the default, BIG_NUM_CTX the big model's, "model=n,model=n" overrides.
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "4096"))
+BIG_NUM_CTX = int(os.getenv("BIG_NUM_CTX", str(LLM_NUM_CTX)))
+LLM_MODEL_NUM_CTX = {
+    m.strip(): int(n)
+    for m, _, n in (item.partition("=") for item in os.getenv("LLM_MODEL_NUM_CTX", "").split(",") if "=" in item)
+}
+# output constraint for chat_json: "schema" (JSON schema, Ollama >= 0.5), "json" (any JSON), "none"
+LLM_FORMAT = os.getenv("LLM_FORMAT", "schema").strip().lower()
+# after a chat_json object closes, read at most this many more pieces waiting for
+# Ollama's final message (only when the caller asked for its metadata)
+DRAIN_PIECES = int(os.getenv("LLM_DRAIN_PIECES", "8"))
+# fields of Ollama's final stream message copied into a caller's `meta` dict
+_META_KEYS = ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration", "load_duration", "total_duration")
+
+# --- scheduling: per-model in-flight limits, priorities, single-flight coalescing ---
+# lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+# default in-flight requests per model; "model=n,model=n" overrides (keep <= OLLAMA_NUM_PARALLEL)
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "2"))
+LLM_MODEL_LIMITS = {
+    m.strip(): int(n)
+    for m, _, n in (item.partition("=") for item in os.getenv("LLM_MODEL_LIMITS", "").split(",") if "=" in item)
+}
+LLM_COALESCE = os.getenv("LLM_COALESCE", "1").strip().lower() in ("1", "true", "yes", "on")
+
+class _ModelQueue:
+    """Counting semaphore whose waiters are woken by (priority, arrival) instead of FIFO."""
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.inflight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.max_depth = 0
+        self.granted = 0
+        self.waits_ms: Deque[float] = deque(maxlen=512)
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for _, _, f in self._waiters if not f.done())
+
+    async def acquire(self, priority: int) -> None:
+        t0 = time.perf_counter()
+        if self.inflight < self.limit and not self.depth:
+            self.inflight += 1
+        else:
+            fut = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+            self.max_depth = max(self.max_depth, self.depth)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    self.release()  # the slot was handed to us just as we were cancelled
+                raise
+        self.granted += 1
+        self.waits_ms.append((time.perf_counter() - t0) * 1000)
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)  # hand the slot straight to the next waiter
+                return
+        self.inflight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        waits = sorted(self.waits_ms)
+        pct = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))], 1) if waits else 0.0
+        return {
+            "limit": self.limit,
+            "inflight": self.inflight,
+            "queued": self.depth,
+            "max_queued": self.max_depth,
+            "granted": self.granted,
+            "wait_ms_p50": pct(0.50),
+            "wait_ms_p95": pct(0.95),
+            "wait_ms_max": round(waits[-1], 1) if waits else 0.0,
+        }
+
+class LLMScheduler:
+    """
+    Process-wide gate in front of Ollama. Each model gets its own queue limited to
+    LLM_MAX_INFLIGHT (or its LLM_MODEL_LIMITS entry) concurrent requests; queued
+    requests are served by priority (PRIORITY_INTERACTIVE before
+    PRIORITY_BACKGROUND). Identical in-flight requests share one call (coalesce).
+    """
+    def __init__(self):
+        self._queues: Dict[str, _ModelQueue] = {}
+        self._inflight: Dict[str, Tuple[asyncio.Task, List[int]]] = {}
+        self.coalesced = 0
+
+    def queue(self, model: str, default_limit: Optional[int] = None) -> _ModelQueue:
+        q = self._queues.get(model)
+        if q is None:
+            limit = LLM_MODEL_LIMITS.get(model, default_limit or LLM_MAX_INFLIGHT)
+            q = self._queues[model] = _ModelQueue(limit)
+        return q
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int = PRIORITY_INTERACTIVE, default_limit: Optional[int] = None):
+        """default_limit: in-flight limit if `model` has no queue yet and no LLM_MODEL_LIMITS entry."""
+        q = self.queue(model, default_limit)
+        await q.acquire(priority)
+        try:
+            yield
+        finally:
+            q.release()
+
+    async def coalesce(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run factory() once per key at a time; concurrent callers with the same key
+        await the same result. The call is cancelled only if every caller gives up.
+        """
+        if not LLM_COALESCE:
+            return await factory()
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(factory())
+            entry = self._inflight[key] = (task, [0])
+            task.add_done_callback(lambda _t, k=key, e=entry: self._inflight.pop(k, None) if self._inflight.get(k) is e else None)
+        else:
+            self.coalesced += 1
+        task, waiters = entry
+        waiters[0] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and waiters[0] == 1:
+                task.cancel()
+            raise
+        finally:
+            waiters[0] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "models": {m: q.stats() for m, q in self._queues.items()},
+            "coalesced": self.coalesced,
+            "inflight_keys": len(self._inflight),
+        }
+
+_SCHEDULER: Optional[LLMScheduler] = None
+
+def get_scheduler() -> LLMScheduler:
+    global _SCHEDULER
+    if _SCHEDULER is None:
+        _SCHEDULER = LLMScheduler()
+    return _SCHEDULER
+
+def _request_key(kind: str, payload: Dict[str, Any]) -> str:
+    blob = json.dumps([kind, payload], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+# --- shared transport: one pooled AsyncClient per process (closed by the app lifespan) ---
+_HTTP: Optional[httpx.AsyncClient] = None
+
+def get_http() -> httpx.AsyncClient:
+    global _HTTP
+    if _HTTP is None or _HTTP.is_closed:
+        _HTTP = httpx.AsyncClient(
+            timeout=float(os.getenv("OLLAMA_TIMEOUT_S", "60")),
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("OLLAMA_POOL_MAX_CONNECTIONS", "16")),
+                max_keepalive_connections=int(os.getenv("OLLAMA_POOL_MAX_KEEPALIVE", "8")),
+            ),
+        )
+    return _HTTP
+
+async def aclose_http() -> None:
+    global _HTTP
+    if _HTTP is not None and not _HTTP.is_closed:
+        await _HTTP.aclose()
+    _HTTP = None
+
+def num_ctx_for(model: str) -> int:
+    """The context size every request to `model` uses."""
+    if model in LLM_MODEL_NUM_CTX:
+        return LLM_MODEL_NUM_CTX[model]
+    return BIG_NUM_CTX if model == BIG_MODEL else LLM_NUM_CTX
+
+def _keep_alive(value):
+    # Ollama accepts durations ("30m") or seconds; "-1" means never unload
+    if value is None:
+        value = KEEP_ALIVE
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
 
 class OllamaClient:
     def __init__(self, base_url=None):
-        self.base = base_url or os.getenv("OLLAMA_URL", "http://localhost:11434")
+        self.base = (base_url or OLLAMA_URL).rstrip("/")
 
-    async def chat(self, system: str, messages, model: str, num_ctx=4096):
+    @staticmethod
+    def _payload(system: str, messages, model: str, num_ctx: Optional[int], keep_alive, stream: bool, fmt=None) -> dict:
         """
         messages: Can be
           - a string (just user content)
@@ -17,19 +219,162 @@ class OllamaClient:
             user = "\n".join([m["content"] for m in messages])
         else:
             user = str(messages)
-        # Build prompt
-        prompt = (system.strip() + "\n" + user.strip()).strip()
+        payload = {
+            "model": model,
+            "system": system.strip(),
+            "prompt": user.strip(),
+            "options": {"num_ctx": num_ctx or num_ctx_for(model)},
+            "keep_alive": _keep_alive(keep_alive),
+            "stream": stream,
+        }
+        if fmt is not None:
+            payload["format"] = fmt
+        return payload
+
+    async def chat(self, system: str, messages, model: str, num_ctx=None, keep_alive=None, priority: int = PRIORITY_INTERACTIVE):
+        payload = self._payload(system, messages, model, num_ctx, keep_alive, stream=False)
+
+        async def call() -> str:
+            t0 = time.perf_counter()
+            async with get_scheduler().slot(model, priority):
+                resp = await get_http().post(f"{self.base}/api/generate", json=payload)
+            resp.raise_for_status()
+            result = resp.json()
+            t1 = time.perf_counter()
+            print(f"LLM call: {model:20} {(t1-t0)*1000:.1f} ms")
+            return result["response"]
+
+        return await get_scheduler().coalesce(_request_key(self.base, payload), call)
+
+    async def chat_stream(
+        self, system: str, messages, model: str, num_ctx=None, keep_alive=None, fmt=None,
+        meta: Optional[Dict[str, Any]] = None, priority: int = PRIORITY_INTERACTIVE,
+    ) -> AsyncIterator[str]:
+        """
+        Same request as chat() with "stream": true; yields response text chunks as
+        Ollama produces them. Closing the generator early closes the HTTP stream,
+        which makes Ollama stop generating. Holds a scheduler slot for `model`
+        while streaming (ttft includes the queue wait).
+        meta: if given, filled from Ollama's final message (prompt_eval_count,
+        durations); stays empty when the stream is closed before Ollama finishes.
+        """
+        t0 = time.perf_counter()
+        first = None
+        payload = self._payload(system, messages, model, num_ctx, keep_alive, stream=True, fmt=fmt)
+        done = False
+        try:
+            async with get_scheduler().slot(model, priority), \
+                    get_http().stream("POST", f"{self.base}/api/generate", json=payload) as resp:
+                resp.raise_for_status()
+                async for line in resp.aiter_lines():
+                    if not line.strip():
+                        continue
+                    msg = json.loads(line)
+                    if msg.get("error"):
+                        raise RuntimeError(f"Ollama stream error: {msg['error']}")
+                    piece = msg.get("response") or ""
+                    if piece:
+                        if first is None:
+                            first = time.perf_counter()
+                        yield piece
+                    if msg.get("done"):
+                        done = True
+                        if meta is not None:
+                            meta.update({k: msg[k] for k in _META_KEYS if k in msg})
+                        break
+        finally:
+            t1 = time.perf_counter()
+            ttft = f"{(first - t0)*1000:.1f}" if first is not None else "-"
+            how = "" if done else " (stopped early)"
+            if meta and "prompt_eval_count" in meta:
+                how += f", prefill {meta['prompt_eval_count']} tok"
+            print(f"LLM stream: {model:20} ttft {ttft} ms, total {(t1-t0)*1000:.1f} ms{how}")
+
+    async def chat_json(
+        self, system: str, messages, model: str, schema: Optional[Dict[str, Any]] = None, num_ctx=None, keep_alive=None,
+        meta: Optional[Dict[str, Any]] = None, priority: int = PRIORITY_INTERACTIVE,
+    ) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        Generate ONE JSON object -> (obj or None, raw text of the object).
+        Output is constrained with Ollama's `format` (see LLM_FORMAT) and parsed
+        while streaming; generation is cut off the moment the top-level object
+        closes, so trailing prose never costs decode time. With `meta`, up to
+        DRAIN_PIECES more pieces are read so Ollama's final message (prefill
+        stats) can still arrive; see chat_stream.
+        Identical concurrent requests are coalesced into one generation.
+        """
+        if LLM_FORMAT == "schema" and schema is not None:
+            fmt = schema
+        elif LLM_FORMAT in ("schema", "json"):
+            fmt = "json"
+        else:
+            fmt = None
+        want_meta = meta is not None
+
+        async def call() -> Tuple[Optional[Dict[str, Any]], str, Dict[str, Any]]:
+            parser = JsonStreamParser()
+            raw: List[str] = []
+            extra = 0
+            got: Dict[str, Any] = {}
+            stream = self.chat_stream(
+                system, messages, model, num_ctx, keep_alive, fmt=fmt,
+                meta=got if want_meta else None, priority=priority,
+            )
+            async with aclosing(stream):
+                async for piece in stream:
+                    if parser.done:
+                        extra += 1
+                        if extra > DRAIN_PIECES:
+                            break
+                        continue
+                    raw.append(piece)
+                    parser.feed(piece)
+                    if parser.done and not want_meta:
+                        break
+            text = parser.text if parser.done else "".join(raw)
+            return parser.obj, text.strip(), got
+
+        payload = self._payload(system, messages, model, num_ctx, keep_alive, stream=True, fmt=fmt)
+        key = _request_key(f"{self.base} json meta={want_meta}", payload)
+        obj, text, got = await get_scheduler().coalesce(key, call)
+        if want_meta:
+            meta.update(got)
+        # followers share the leader's parsed object; hand each caller its own copy
+        return (json.loads(json.dumps(obj)) if isinstance(obj, dict) else obj), text
+
+    async def load(self, model: str, embedding: bool = False, keep_alive=None) -> float:
+        """
+        Ask Ollama to load `model` without generating anything; returns load time in ms.
+        Generation models are loaded with the num_ctx real requests send, otherwise the
+        first real request would reload the runner anyway.
+        """
         t0 = time.perf_counter()
-        async with httpx.AsyncClient(timeout=60) as client:
-            resp = await client.post(f"{self.base}/api/generate", json={
-                "model": model,
-                "system": system.strip(),
-                "prompt": user.strip(),
-                "num_ctx": num_ctx,
-                "stream": False
-            })
+        if embedding:
+            # embedding requests send no options (see data.embedding): load it the same way
+            body = {"model": model, "input": " ", "keep_alive": _keep_alive(keep_alive)}
+            resp = await get_http().post(f"{self.base}/api/embed", json=body)
+        else:
+            # a generate request with an empty prompt only loads the model
+            body = {
+                "model": model, "prompt": "", "keep_alive": _keep_alive(keep_alive), "stream": False,
+                "options": {"num_ctx": num_ctx_for(model)},
+            }
+            resp = await get_http().post(f"{self.base}/api/generate", json=body)
         resp.raise_for_status()
-        result = resp.json()
-        t1 = time.perf_counter()
-        print(f"LLM call: {model:20} {(t1-t0)*1000:.1f} ms")
-        return result["response"]
+        return (time.perf_counter() - t0) * 1000
+
+    async def resident_models(self) -> List[str]:
+        """Models currently loaded in Ollama (/api/ps)."""
+        resp = await get_http().get(f"{self.base}/api/ps")
+        resp.raise_for_status()
+        return [m.get("name") or m.get("model") for m in (resp.json().get("models") or [])]
+
+async def warmup(models: List[str], embed_models: List[str] = ()) -> None:
+    """Load models one after another (parallel loads just fight over VRAM). Errors are logged, not raised."""
+    cli = OllamaClient()
+    for model, emb in [(m, False) for m in models] + [(m, True) for m in embed_models]:
+        try:
+            ms = await cli.load(model, embedding=emb)
+            print(f"LLM warmup: {model:20} {ms:.1f} ms")
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            print(f"LLM warmup: {model:20} failed: {type(e).__name__}: {e}")
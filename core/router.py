@@ -0,0 +1,182 @@
+# core/router.py
+import asyncio
+import os
+import random
+import re
+from collections import deque
+from typing import Any, Coroutine, Deque, Dict, List, Literal, Optional
+
+from pydantic import BaseModel
+
+from core.big_llm import Decision
+from core.bundle import Bundle
+from core.fast_path import reply_for
+
+ROUTER_ENABLED = os.getenv("ROUTER", "0").strip().lower() in ("1", "true", "yes", "on")
+# scores are cosine similarities of retrieval hits (same scale for every VECTOR_BACKEND)
+# execute without any decision model: top device/action this strong and this far ahead
+ROUTER_DIRECT_MIN_SCORE = float(os.getenv("ROUTER_DIRECT_MIN_SCORE", "0.85"))
+ROUTER_DIRECT_MIN_MARGIN = float(os.getenv("ROUTER_DIRECT_MIN_MARGIN", "0.15"))
+# let the small model decide
+ROUTER_SMALL_MIN_SCORE = float(os.getenv("ROUTER_SMALL_MIN_SCORE", "0.7"))
+ROUTER_SMALL_MIN_MARGIN = float(os.getenv("ROUTER_SMALL_MIN_MARGIN", "0.08"))
+# added to a device's score when its area/name matches context["room"]
+ROUTER_ROOM_BONUS = float(os.getenv("ROUTER_ROOM_BONUS", "0.05"))
+# share of direct/small turns re-decided by the big model in the background to measure agreement
+ROUTER_SHADOW_RATE = float(os.getenv("ROUTER_SHADOW_RATE", "0.1"))
+
+Route = Literal["direct", "small", "big"]
+ROUTES = ("direct", "small", "big")
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+def _words(text: str) -> set:
+    return set(_WORD.findall((text or "").lower().replace("_", " ")))
+
+class RouteDecision(BaseModel):
+    route: Route
+    confidence: float = 0.0     # top device score (room bonus included)
+    margin: float = 0.0         # top-1 minus top-2 device score
+    device: Optional[str] = None
+    action: Optional[str] = None
+    reply: Optional[str] = None
+
+    def decision(self) -> Optional[Decision]:
+        """The EXECUTE decision of a direct route."""
+        if self.route != "direct":
+            return None
+        return Decision(mode="EXECUTE", device=self.device, action=self.action, args={}, reply=self.reply)
+
+class _RouteStats:
+    def __init__(self):
+        self.count = 0
+        self.ms: Deque[float] = deque(maxlen=512)
+        self.shadowed = 0
+        self.agreed = 0
+
+    def report(self) -> Dict[str, Any]:
+        ms = sorted(self.ms)
+        pct = lambda q: round(ms[min(len(ms) - 1, int(q * len(ms)))], 1) if ms else 0.0
+        return {
+            "count": self.count,
+            "ms_p50": pct(0.50),
+            "ms_p95": pct(0.95),
+            "shadowed": self.shadowed,
+            "agreement": round(self.agreed / self.shadowed, 4) if self.shadowed else None,
+        }
+
+class ConfidenceRouter:
+    """
+    Picks the cheapest decision path for a retrieved turn:
+      direct - one device and one service clearly ahead, and the small LLM's
+               `service` keyword agrees: execute without a decision model
+      small  - a clear top device: the small model makes the decision
+      big    - anything ambiguous
+    Accuracy of direct/small is estimated by re-deciding ROUTER_SHADOW_RATE of
+    them with the big model at background priority and comparing device/action.
+    """
+    def __init__(
+        self,
+        direct_min_score: float = ROUTER_DIRECT_MIN_SCORE,
+        direct_min_margin: float = ROUTER_DIRECT_MIN_MARGIN,
+        small_min_score: float = ROUTER_SMALL_MIN_SCORE,
+        small_min_margin: float = ROUTER_SMALL_MIN_MARGIN,
+        room_bonus: float = ROUTER_ROOM_BONUS,
+        shadow_rate: float = ROUTER_SHADOW_RATE,
+    ):
+        self.direct_min_score = direct_min_score
+        self.direct_min_margin = direct_min_margin
+        self.small_min_score = small_min_score
+        self.small_min_margin = small_min_margin
+        self.room_bonus = room_bonus
+        self.shadow_rate = shadow_rate
+        self._stats = {r: _RouteStats() for r in ROUTES}
+        self._shadows: set = set()
+
+    # ---------- routing ----------
+    def _device_scores(self, bundle: Bundle, context: Dict[str, Any]) -> List[tuple]:
+        room = _words(str((context or {}).get("room") or ""))
+        out = []
+        for d in bundle.devices:
+            eid = d["entity_id"]
+            if eid not in bundle.scores:
+                continue
+            score = bundle.scores[eid]
+            if room and room <= (_words(str(d.get("area") or "")) | _words(d.get("name") or "") | _words(eid)):
+                score += self.room_bonus
+            out.append((score, d))
+        out.sort(key=lambda x: x[0], reverse=True)
+        return out
+
+    def route(self, bundle: Bundle, context: Dict[str, Any], intent: Optional[Dict[str, Any]] = None) -> RouteDecision:
+        devices = self._device_scores(bundle, context)
+        if not devices:
+            return RouteDecision(route="big")
+        top, best = devices[0]
+        margin = top - devices[1][0] if len(devices) > 1 else top
+        out = RouteDecision(route="big", confidence=round(top, 4), margin=round(margin, 4))
+
+        if top >= self.direct_min_score and margin >= self.direct_min_margin:
+            domain = best.get("domain")
+            acts = sorted(
+                ((bundle.scores[a["action"]], a) for a in bundle.actions
+                 if a.get("domain") == domain and a["action"] in bundle.scores),
+                key=lambda x: x[0], reverse=True,
+            )
+            wanted = _words(str(intent.get("service") or "")) if isinstance(intent, dict) else set()
+            if acts and wanted:
+                a_top, act = acts[0]
+                a_margin = a_top - acts[1][0] if len(acts) > 1 else a_top
+                # the model's own guess must name this service ("turn_off" vs "turn_on" embed too close to trust)
+                if a_margin >= self.direct_min_margin and _words(act["service"]) <= wanted:
+                    out.route = "direct"
+                    out.device, out.action = best["entity_id"], act["action"]
+                    out.reply = reply_for(act["service"], best.get("name") or best["entity_id"])
+                    return out
+        if top >= self.small_min_score and margin >= self.small_min_margin:
+            out.route = "small"
+        return out
+
+    # ---------- reporting ----------
+    def record(self, route: Route, ms: float) -> None:
+        st = self._stats[route]
+        st.count += 1
+        st.ms.append(ms)
+
+    def maybe_shadow(self, route: Route, decision: Optional[Decision], big: Coroutine[Any, Any, Optional[Decision]]) -> None:
+        """Compare a cheap route's decision with the big model's in the background (sampled)."""
+        if route == "big" or random.random() >= self.shadow_rate:
+            big.close()
+            return
+
+        async def check():
+            try:
+                ref = await big
+            except Exception as e:
+                print(f"[router] shadow check failed: {type(e).__name__}: {e}")
+                return
+            st = self._stats[route]
+            st.shadowed += 1
+            same = (
+                decision is not None and ref is not None and decision.mode == ref.mode
+                and (decision.mode == "REPLY" or (sorted(decision.targets), decision.action) == (sorted(ref.targets), ref.action))
+            )
+            st.agreed += int(same)
+
+        task = asyncio.create_task(check())
+        self._shadows.add(task)
+        task.add_done_callback(self._shadows.discard)
+
+    def stats(self) -> Dict[str, Any]:
+        return {r: self._stats[r].report() for r in ROUTES}
+
+_ROUTER: Optional[ConfidenceRouter] = None
+
+def get_router() -> Optional[ConfidenceRouter]:
+    """Process-wide router, or None when ROUTER=0 (every turn goes to the big model)."""
+    global _ROUTER
+    if not ROUTER_ENABLED:
+        return None
+    if _ROUTER is None:
+        _ROUTER = ConfidenceRouter()
+    return _ROUTER
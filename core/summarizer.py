@@ -0,0 +1,144 @@
+# core/summarizer.py
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from core.intent_extractor import SMALL_MODEL
+from core.llm_client import PRIORITY_BACKGROUND, OllamaClient
+from data.message_log import get_message_log
+
+SUMMARY_ENABLED = os.getenv("SUMMARIZER", "1").strip().lower() in ("1", "true", "yes", "on")
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", SMALL_MODEL)
+# new messages in a chat before its summary is refreshed
+SUMMARY_EVERY_MESSAGES = int(os.getenv("SUMMARY_EVERY_MESSAGES", "8"))
+# chats summarized per round, and how long a round waits to fill up
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", "8"))
+SUMMARY_INTERVAL_S = float(os.getenv("SUMMARY_INTERVAL_S", "5"))
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "80"))
+
+SYSTEM = (
+    "You maintain the running summary of a smart-home assistant chat.\n"
+    "Given the summary so far and the newest messages, return the updated summary.\n"
+    "Rules:\n"
+    "- Keep user preferences, named devices/rooms, routines and open requests.\n"
+    "- Drop greetings, confirmations and anything superseded.\n"
+    f"- At most {SUMMARY_MAX_WORDS} words, plain text, no preamble.\n"
+)
+
+def _prompt(summary: str, messages: List[Dict[str, Any]]) -> str:
+    lines = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    return f"Summary so far:\n{summary or '(none)'}\n\nNew messages:\n{lines}"
+
+class Summarizer:
+    """
+    Refreshes chat summaries off the request path. note_messages() only counts;
+    once a chat has SUMMARY_EVERY_MESSAGES new messages it is queued, and a
+    background worker summarizes queued chats in rounds of up to SUMMARY_BATCH at
+    PRIORITY_BACKGROUND. Each update folds just the new messages into the previous
+    summary, then stores it through the message log (write-behind).
+    """
+    def __init__(self, every: int = SUMMARY_EVERY_MESSAGES, batch: int = SUMMARY_BATCH, model: str = SUMMARY_MODEL):
+        self.every = every
+        self.batch = batch
+        self.model = model
+        self._new: Dict[str, int] = {}                      # chat_id -> messages since last summary
+        self._due: "OrderedDict[str, float]" = OrderedDict()  # chat_id -> monotonic time it became due
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.done = 0
+        self.failed = 0
+        self.last_round_ms = 0.0
+        self.last_lag_s = 0.0
+
+    def note_messages(self, chat_id: str, n: int = 2) -> None:
+        """Count new messages for chat_id (never blocks)."""
+        self._new[chat_id] = self._new.get(chat_id, 0) + n
+        if self._new[chat_id] >= self.every and chat_id not in self._due:
+            self._due[chat_id] = time.monotonic()
+            if len(self._due) >= self.batch:
+                self._wake.set()
+
+    async def summarize(self, chat_id: str) -> Optional[str]:
+        log = get_message_log()
+        n = self._new.get(chat_id, 0)
+        if n <= 0:
+            return None
+        messages = await log.recent(chat_id, n)
+        previous = await log.summary(chat_id)
+        text = await OllamaClient().chat(
+            SYSTEM, _prompt(previous, messages), model=self.model, priority=PRIORITY_BACKGROUND,
+        )
+        text = " ".join((text or "").split())
+        if not text:
+            return None
+        await log.set_summary(chat_id, text)
+        # messages that arrived while we were summarizing count toward the next round
+        self._new[chat_id] = max(0, self._new.get(chat_id, 0) - n)
+        return text
+
+    async def _round(self) -> None:
+        chats = []
+        while self._due and len(chats) < self.batch:
+            chat_id, since = self._due.popitem(last=False)
+            chats.append(chat_id)
+            self.last_lag_s = time.monotonic() - since
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(self.summarize(c) for c in chats), return_exceptions=True)
+        for chat_id, res in zip(chats, results):
+            if isinstance(res, BaseException):
+                self.failed += 1
+                print(f"[summarizer] {chat_id}: {type(res).__name__}: {res}")
+            else:
+                self.done += 1
+        self.last_round_ms = (time.perf_counter() - t0) * 1000
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), SUMMARY_INTERVAL_S)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self._due:
+                await self._round()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()  # bind to the running loop
+            if len(self._due) >= self.batch:
+                self._wake.set()
+            self._task = asyncio.create_task(self._run(), name="summarizer")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        oldest = next(iter(self._due.values()), None)
+        return {
+            "queued": len(self._due),
+            "lag_s": round(now - oldest, 2) if oldest is not None else 0.0,  # age of the oldest queued chat
+            "last_lag_s": round(self.last_lag_s, 2),                        # queue wait of the last chat taken
+            "last_round_ms": round(self.last_round_ms, 1),
+            "done": self.done,
+            "failed": self.failed,
+        }
+
+_SUMMARIZER: Optional[Summarizer] = None
+
+def get_summarizer() -> Optional[Summarizer]:
+    """Process-wide summarizer, or None when SUMMARIZER=0."""
+    global _SUMMARIZER
+    if not SUMMARY_ENABLED:
+        return None
+    if _SUMMARIZER is None:
+        _SUMMARIZER = Summarizer()
+    return _SUMMARIZER
@@ -0,0 +1,177 @@
+# smarthub/data/embed_cache.py
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+EMBED_CACHE_PATH = os.environ.get("EMBED_CACHE_PATH", "./.embcache")
+EMBED_CACHE_MEM_ITEMS = int(os.environ.get("EMBED_CACHE_MEM_ITEMS", "4096"))
+EMBED_CACHE_ENABLED = os.environ.get("EMBED_CACHE", "1").strip().lower() in ("1", "true", "yes", "on")
+
+def text_key(text: str) -> str:
+    return hashlib.sha1((text or " ").encode("utf-8")).hexdigest()
+
+class _DiskTier:
+    """
+    Append-only store for one model:
+      <root>/<model>/meta.json    {"dim": N}
+      <root>/<model>/keys.txt     one sha1 per row
+      <root>/<model>/vectors.f32  rows of N float32, read through np.memmap
+    Vectors are appended before keys, so a crash leaves at most an orphan row
+    that is ignored on load. Meant for a single writer process.
+    """
+    def __init__(self, root: str, model: str):
+        self.dir = os.path.join(root, re.sub(r"[^A-Za-z0-9._-]+", "_", model))
+        self.dim: Optional[int] = None
+        self.rows: Dict[str, int] = {}
+        self._mm: Optional[np.memmap] = None
+        self._load()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.dir, name)
+
+    def _load(self) -> None:
+        if not os.path.exists(self._path("meta.json")):
+            return
+        with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+            self.dim = int(json.load(f)["dim"])
+        keys: List[str] = []
+        if os.path.exists(self._path("keys.txt")):
+            with open(self._path("keys.txt"), "r", encoding="utf-8") as f:
+                keys = [ln.strip() for ln in f if len(ln.strip()) == 40]
+        vec_bytes = os.path.getsize(self._path("vectors.f32")) if os.path.exists(self._path("vectors.f32")) else 0
+        n = min(len(keys), vec_bytes // (4 * self.dim))
+        if vec_bytes != n * 4 * self.dim:
+            # drop a torn/orphan tail so new rows line up with keys again
+            with open(self._path("vectors.f32"), "r+b") as f:
+                f.truncate(n * 4 * self.dim)
+        if len(keys) != n:
+            keys = keys[:n]
+            with open(self._path("keys.txt"), "w", encoding="utf-8") as f:
+                f.writelines(k + "\n" for k in keys)
+        self.rows = {k: i for i, k in enumerate(keys)}
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        if self._mm is None or row >= self._mm.shape[0]:
+            self._mm = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r",
+                                 shape=(len(self.rows), self.dim))
+        return np.array(self._mm[row])
+
+    def put_many(self, items: Sequence[Tuple[str, np.ndarray]]) -> None:
+        items = [(k, v) for k, v in items if k not in self.rows]
+        if not items:
+            return
+        if self.dim is None:
+            os.makedirs(self.dir, exist_ok=True)
+            self.dim = int(items[0][1].shape[0])
+            with open(self._path("meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim}, f)
+        kept = [(k, v) for k, v in items if v.shape[0] == self.dim]
+        if len(kept) != len(items):
+            # e.g. the model was re-pulled under the same tag with a new dimension
+            dims = sorted({int(v.shape[0]) for _, v in items if v.shape[0] != self.dim})
+            print(f"[embed-cache] {self.dir}: not storing {len(items) - len(kept)} vectors of dim {dims} "
+                  f"(cache holds dim {self.dim}; delete the directory to rebuild it)")
+        items = kept
+        if not items:
+            return
+        block = np.stack([v for _, v in items]).astype(np.float32, copy=False)
+        with open(self._path("vectors.f32"), "ab") as f:
+            f.write(block.tobytes())
+            f.flush()
+        with open(self._path("keys.txt"), "a", encoding="utf-8") as f:
+            f.writelines(k + "\n" for k, _ in items)
+        start = len(self.rows)
+        for i, (k, _) in enumerate(items):
+            self.rows[k] = start + i
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model, sha1(text)).
+    Tier 1: bounded in-memory LRU. Tier 2: per-model float32 file on disk (optional).
+    """
+    def __init__(self, path: Optional[str] = EMBED_CACHE_PATH, max_items: int = EMBED_CACHE_MEM_ITEMS):
+        self.path = path
+        self.max_items = max_items
+        self._lru: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._disk: Dict[str, _DiskTier] = {}
+        self._lock = threading.Lock()
+        self.hits_mem = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def _tier(self, model: str) -> Optional[_DiskTier]:
+        if not self.path:
+            return None
+        tier = self._disk.get(model)
+        if tier is None:
+            tier = self._disk[model] = _DiskTier(self.path, model)
+        return tier
+
+    def _remember(self, k: Tuple[str, str], vec: np.ndarray) -> None:
+        self._lru[k] = vec
+        self._lru.move_to_end(k)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        out: List[Optional[List[float]]] = []
+        with self._lock:
+            tier = self._tier(model)
+            for t in texts:
+                k = (model, text_key(t))
+                vec = self._lru.get(k)
+                if vec is not None:
+                    self._lru.move_to_end(k)
+                    self.hits_mem += 1
+                elif tier is not None and (vec := tier.get(k[1])) is not None:
+                    self._remember(k, vec)
+                    self.hits_disk += 1
+                else:
+                    self.misses += 1
+                out.append(vec.tolist() if vec is not None else None)
+        return out
+
+    def put_many(self, model: str, texts: Sequence[str], vecs: Sequence[Sequence[float]]) -> None:
+        with self._lock:
+            fresh: Dict[str, np.ndarray] = {}
+            for t, v in zip(texts, vecs):
+                k = (model, text_key(t))
+                arr = np.asarray(v, dtype=np.float32)
+                self._remember(k, arr)
+                fresh[k[1]] = arr
+            tier = self._tier(model)
+            if tier is not None:
+                tier.put_many(list(fresh.items()))
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits_mem + self.hits_disk + self.misses
+        return {
+            "hits_mem": self.hits_mem,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round((self.hits_mem + self.hits_disk) / lookups, 4) if lookups else 0.0,
+            "mem_items": len(self._lru),
+            "disk_items": sum(len(t.rows) for t in self._disk.values()),
+        }
+
+_CACHE: Optional[EmbeddingCache] = None
+
+def get_cache() -> Optional[EmbeddingCache]:
+    """Process-wide cache, or None when EMBED_CACHE=0."""
+    global _CACHE
+    if not EMBED_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        _CACHE = EmbeddingCache()
+    return _CACHE
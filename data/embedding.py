@@ -2,18 +2,31 @@
 from __future__ import annotations
 
 from typing import List, Iterable, Optional
+import asyncio
 import os
 import httpx
 
-# Ollama embeddings endpoint expects a single string under "prompt"
+from core.llm_client import PRIORITY_INTERACTIVE, _keep_alive, get_http as get_ollama_http, get_scheduler
+from data.embed_cache import get_cache
+
+# Legacy Ollama endpoint expects a single string under "prompt";
+# /api/embed takes a list under "input" and returns {"embeddings": [[...], ...]}.
 OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
 EMBED_ENDPOINT = os.environ.get("OLLAMA_EMBED_ENDPOINT", "/api/embeddings")
 EMBED_URL = f"{OLLAMA_URL.rstrip('/')}{EMBED_ENDPOINT}"
+EMBED_BATCH_ENDPOINT = os.environ.get("OLLAMA_EMBED_BATCH_ENDPOINT", "/api/embed")
+EMBED_BATCH_URL = f"{OLLAMA_URL.rstrip('/')}{EMBED_BATCH_ENDPOINT}"
 DEFAULT_TIMEOUT = float(os.environ.get("EMBED_TIMEOUT_S", "60.0"))
+# same OLLAMA_KEEP_ALIVE parsing as the generation calls: "-1" must go out as the int -1
+EMBED_KEEP_ALIVE = _keep_alive(None)
+# texts per /api/embed request (1 = legacy one-text-per-request endpoint)
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "64"))
+# requests in flight at once
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "4"))
 
 async def _embed_one(text: str, model: str, client: httpx.AsyncClient) -> List[float]:
-    payload = {"model": model, "prompt": text or " "}
-    r = await client.post(EMBED_URL, json=payload, headers={"Content-Type": "application/json"})
+    payload = {"model": model, "prompt": text or " ", "keep_alive": EMBED_KEEP_ALIVE}
+    r = await client.post(EMBED_URL, json=payload, headers={"Content-Type": "application/json"}, timeout=DEFAULT_TIMEOUT)
     r.raise_for_status()
     data = r.json()
     emb = data.get("embedding")
@@ -21,12 +34,70 @@ async def _embed_one(text: str, model: str, client: httpx.AsyncClient) -> List[f
         raise RuntimeError(f"Embedding missing/empty; response keys={list(data.keys())}")
     return [float(x) for x in emb]
 
-async def embed_texts(texts: Iterable[str], model: str) -> List[List[float]]:
+async def _embed_batch(texts: List[str], model: str, client: httpx.AsyncClient) -> List[List[float]]:
+    payload = {"model": model, "input": [t or " " for t in texts], "keep_alive": EMBED_KEEP_ALIVE}
+    r = await client.post(EMBED_BATCH_URL, json=payload, headers={"Content-Type": "application/json"}, timeout=DEFAULT_TIMEOUT)
+    r.raise_for_status()
+    data = r.json()
+    embs = data.get("embeddings")
+    if not isinstance(embs, list) or len(embs) != len(texts):
+        got = len(embs) if isinstance(embs, list) else None
+        raise RuntimeError(f"Batch embedding size mismatch: sent {len(texts)}, got {got}; keys={list(data.keys())}")
+    return [[float(x) for x in emb] for emb in embs]
+
+async def embed_texts(
+    texts: Iterable[str],
+    model: str,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    client: Optional[httpx.AsyncClient] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> List[List[float]]:
+    """
+    Embed texts in input order. Cached vectors (data.embed_cache) are reused;
+    the remaining unique texts are split into chunks of `batch_size` sent to
+    /api/embed, with at most `concurrency` chunks in flight. Each chunk also
+    takes a slot in the LLM scheduler's queue for `model`, so bulk (background
+    priority) embedding yields to interactive queries.
+    batch_size=1 uses the legacy /api/embeddings endpoint (one text per request).
+    """
     items = list(texts)
     if not items:
         return []
-    async with httpx.AsyncClient(timeout=DEFAULT_TIMEOUT) as cli:
-        out: List[List[float]] = []
-        for t in items:  # simple & predictable
-            out.append(await _embed_one(t, model, cli))
-        return out
+    cache = get_cache() if use_cache else None
+    if cache is None:
+        return await _embed_uncached(items, model, batch_size, concurrency, client, priority)
+
+    out = cache.get_many(model, items)
+    todo = list(dict.fromkeys(t for t, v in zip(items, out) if v is None))
+    if todo:
+        fresh = await _embed_uncached(todo, model, batch_size, concurrency, client, priority)
+        cache.put_many(model, todo, fresh)
+        by_text = dict(zip(todo, fresh))
+        out = [v if v is not None else by_text[t] for t, v in zip(items, out)]
+    return out
+
+async def _embed_uncached(
+    items: List[str],
+    model: str,
+    batch_size: Optional[int],
+    concurrency: Optional[int],
+    client: Optional[httpx.AsyncClient],
+    priority: int = PRIORITY_INTERACTIVE,
+) -> List[List[float]]:
+    size = max(1, batch_size or EMBED_BATCH_SIZE)
+    sem = asyncio.Semaphore(max(1, concurrency or EMBED_CONCURRENCY))
+    chunks = [items[i:i + size] for i in range(0, len(items), size)]
+
+    async def run_chunk(cli: httpx.AsyncClient, chunk: List[str]) -> List[List[float]]:
+        async with sem, get_scheduler().slot(model, priority, default_limit=EMBED_CONCURRENCY):
+            if size == 1:
+                return [await _embed_one(chunk[0], model, cli)]
+            return await _embed_batch(chunk, model, cli)
+
+    async def run_all(cli: httpx.AsyncClient) -> List[List[float]]:
+        parts = await asyncio.gather(*(run_chunk(cli, c) for c in chunks))
+        return [vec for part in parts for vec in part]
+
+    return await run_all(client or get_ollama_http())
@@ -0,0 +1,273 @@
+# data/message_log.py
+import asyncio
+import atexit
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from data.repo import Repo, get_repo
+
+# messages kept in memory per chat (newest win)
+HISTORY_BUFFER_MESSAGES = int(os.getenv("HISTORY_BUFFER_MESSAGES", "50"))
+# chats kept in memory; least recently used (and fully flushed) chats are dropped first
+HISTORY_MAX_CHATS = int(os.getenv("HISTORY_MAX_CHATS", "1000"))
+# write-behind queue: appends block only when this many writes are waiting
+HISTORY_QUEUE_MAX = int(os.getenv("HISTORY_QUEUE_MAX", "10000"))
+HISTORY_FLUSH_BATCH = int(os.getenv("HISTORY_FLUSH_BATCH", "256"))
+HISTORY_FLUSH_INTERVAL_MS = float(os.getenv("HISTORY_FLUSH_INTERVAL_MS", "50"))
+# how long close() lets the writer drain before falling back to one synchronous attempt
+HISTORY_CLOSE_TIMEOUT_S = float(os.getenv("HISTORY_CLOSE_TIMEOUT_S", "5"))
+
+def _now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+class _ChatBuffer:
+    __slots__ = ("messages", "summary", "pending", "loader", "loaded")
+
+    def __init__(self, size: int):
+        self.messages: Deque[Dict[str, Any]] = deque(maxlen=size)
+        self.summary = ""
+        self.pending = 0          # queued writes not yet committed
+        self.loader: Optional[asyncio.Task] = None
+        self.loaded = False       # False after a failed load: the next access retries it
+
+    def stamp(self) -> int:
+        """created_at for a new message: strictly increasing within the chat."""
+        last = self.messages[-1]["created_at"] if self.messages else 0
+        return max(_now_ms(), last + 1)
+
+class MessageLog:
+    """
+    Write-behind chat history. Each chat keeps a ring buffer of its last
+    HISTORY_BUFFER_MESSAGES messages plus its summary; reads are served from
+    memory (a chat's first access loads it from the Repo once). Writes update
+    the buffer immediately and are queued for a background writer that commits
+    them in batches of up to HISTORY_FLUSH_BATCH per transaction.
+    close() drains the queue; anything still unwritten at interpreter exit is
+    flushed synchronously.
+    """
+    def __init__(
+        self,
+        repo: Optional[Repo] = None,
+        buffer_messages: int = HISTORY_BUFFER_MESSAGES,
+        max_chats: int = HISTORY_MAX_CHATS,
+        queue_max: int = HISTORY_QUEUE_MAX,
+    ):
+        self.repo = repo or get_repo()
+        self.buffer_messages = buffer_messages
+        self.max_chats = max_chats
+        self._chats: "OrderedDict[str, _ChatBuffer]" = OrderedDict()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_max)
+        self._inflight: List[Dict[str, Any]] = []
+        self._writing: Optional[asyncio.Future] = None  # the commit of _inflight, running in a thread
+        self._writer: Optional[asyncio.Task] = None
+        self.flushed = 0
+        self.batches = 0
+        self.errors = 0
+        atexit.register(self._flush_sync)
+
+    # ---------- buffers ----------
+    async def _load(self, chat_id: str, buf: _ChatBuffer) -> None:
+        try:
+            rows = await self.repo.recent_messages(chat_id, self.buffer_messages)
+            summary = await self.repo.load_summary(chat_id)
+        except Exception as e:
+            print(f"[history] load {chat_id} failed: {type(e).__name__}: {e}")
+            return
+        # after a failed load the buffer may already hold newer messages, some of them committed
+        held = {(m["role"], m["content"], m["created_at"]) for m in buf.messages}
+        older = [r for r in rows if (r.role, r.content, r.created_at) not in held]
+        free = self.buffer_messages - len(buf.messages)
+        buf.messages.extendleft(
+            {"role": r.role, "content": r.content, "created_at": r.created_at}
+            for r in reversed(older[-free:] if free > 0 else [])
+        )
+        buf.summary = buf.summary or summary
+        buf.loaded = True
+
+    def _evict(self) -> None:
+        for chat_id in list(self._chats):
+            if len(self._chats) <= self.max_chats:
+                return
+            buf = self._chats[chat_id]
+            if buf.pending == 0 and buf.loader is not None and buf.loader.done():
+                del self._chats[chat_id]
+
+    async def _buffer(self, chat_id: str) -> _ChatBuffer:
+        buf = self._chats.get(chat_id)
+        if buf is None:
+            buf = self._chats[chat_id] = _ChatBuffer(self.buffer_messages)
+            buf.loader = asyncio.create_task(self._load(chat_id, buf))
+            self._evict()
+        else:
+            self._chats.move_to_end(chat_id)
+            if buf.loader.done() and not buf.loaded:
+                buf.loader = asyncio.create_task(self._load(chat_id, buf))
+        if not buf.loader.done():
+            await asyncio.shield(buf.loader)
+        return buf
+
+    def prefetch(self, chat_id: str) -> None:
+        """Start loading a chat's buffer without waiting for it."""
+        if chat_id not in self._chats:
+            asyncio.ensure_future(self._buffer(chat_id))
+
+    # ---------- reads ----------
+    async def recent(self, chat_id: str, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Last n buffered messages ({role, content, created_at}), oldest first."""
+        msgs = list((await self._buffer(chat_id)).messages)
+        return msgs[-n:] if n else msgs
+
+    async def summary(self, chat_id: str) -> str:
+        return (await self._buffer(chat_id)).summary
+
+    def peek(self, chat_id: str) -> Tuple[List[Dict[str, Any]], str]:
+        """(messages, summary) already in memory; never touches the database."""
+        buf = self._chats.get(chat_id)
+        if buf is None or not buf.loader.done():
+            return [], ""
+        return list(buf.messages), buf.summary
+
+    # ---------- writes ----------
+    async def _enqueue(self, buf: _ChatBuffer, item: Dict[str, Any]) -> None:
+        buf.pending += 1
+        await self._queue.put(item)  # waits only when the writer is HISTORY_QUEUE_MAX behind
+        self.start()
+
+    async def append(self, chat_id: str, role: str, content: str, tenant_id: Optional[str] = None) -> None:
+        buf = await self._buffer(chat_id)
+        msg = {"role": role, "content": content, "created_at": buf.stamp()}
+        buf.messages.append(msg)
+        await self._enqueue(buf, {"chat_id": chat_id, "tenant_id": tenant_id, **msg})
+
+    async def add_turn(self, chat_id: str, user_message: str, reply: str, tenant_id: Optional[str] = None) -> None:
+        buf = await self._buffer(chat_id)
+        # both messages are stamped and buffered before any await: a concurrent turn of
+        # the same chat can't land between them
+        msgs = []
+        for role, content in (("user", user_message), ("assistant", reply)):
+            msgs.append({"role": role, "content": content, "created_at": buf.stamp()})
+            buf.messages.append(msgs[-1])
+        for msg in msgs:
+            await self._enqueue(buf, {"chat_id": chat_id, "tenant_id": tenant_id, **msg})
+
+    async def set_summary(self, chat_id: str, summary: str) -> None:
+        buf = await self._buffer(chat_id)
+        buf.summary = summary
+        await self._enqueue(buf, {"chat_id": chat_id, "summary": summary})
+
+    # ---------- writer ----------
+    def start(self) -> None:
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._run(), name="history-writer")
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        # collected straight into _inflight so a cancelled writer never drops what it took
+        batch = self._inflight = [await self._queue.get()]
+        deadline = time.perf_counter() + HISTORY_FLUSH_INTERVAL_MS / 1000
+        while len(batch) < HISTORY_FLUSH_BATCH:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        backoff = 0.1
+        while True:
+            # shielded: cancelling the writer can't stop a commit already running in its thread
+            self._writing = asyncio.ensure_future(self.repo.write_batch(batch))
+            try:
+                await asyncio.shield(self._writing)
+                break
+            except Exception as e:
+                # keep the batch; the bounded queue pushes back on writers meanwhile
+                self.errors += 1
+                print(f"[history] flush of {len(batch)} writes failed: {type(e).__name__}: {e}; retrying")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 5.0)
+        self._writing = None
+        self._inflight = []
+        self.flushed += len(batch)
+        self.batches += 1
+        for it in batch:
+            buf = self._chats.get(it["chat_id"])
+            if buf is not None:
+                buf.pending -= 1
+        for _ in batch:
+            self._queue.task_done()
+
+    async def _run(self) -> None:
+        while True:
+            await self._write(await self._next_batch())
+
+    async def close(self, timeout: float = HISTORY_CLOSE_TIMEOUT_S) -> None:
+        """Flush everything queued (waiting at most `timeout`), then stop the writer."""
+        if self._writer is not None and not self._writer.done():
+            deadline = time.monotonic() + timeout
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                # the writer is stuck retrying (database down): don't hold up shutdown
+                print(f"[history] writer still busy after {timeout:.0f}s; {self._queue.qsize()} writes queued")
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            await self._settle_inflight(max(0.0, deadline - time.monotonic()))
+        self._writer = None
+        self._flush_sync()
+
+    async def _settle_inflight(self, timeout: float) -> None:
+        """After cancelling the writer: drop _inflight if its commit went (or may still go) through."""
+        writing, self._writing = self._writing, None
+        if writing is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(writing), timeout)
+        except asyncio.TimeoutError:
+            # still running: writing the batch again could duplicate it, so leave it to that commit
+            print(f"[history] commit of {len(self._inflight)} writes still running at shutdown; left to it")
+            self._inflight = []
+        except Exception:
+            pass  # failed: _flush_sync retries the batch
+        else:
+            self._inflight = []
+
+    def _flush_sync(self) -> None:
+        """Last-chance synchronous flush (interpreter exit / no running writer)."""
+        items = list(self._inflight)
+        while not self._queue.empty():
+            items.append(self._queue.get_nowait())
+            self._queue.task_done()
+        self._inflight = []
+        if not items:
+            return
+        try:
+            self.repo.write_batch_sync(items)
+            self.flushed += len(items)
+            print(f"[history] flushed {len(items)} pending writes on shutdown")
+        except Exception as e:
+            print(f"[history] lost {len(items)} writes on shutdown: {type(e).__name__}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chats": len(self._chats),
+            "queued": self._queue.qsize(),
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "errors": self.errors,
+        }
+
+_LOG: Optional[MessageLog] = None
+
+def get_message_log() -> MessageLog:
+    global _LOG
+    if _LOG is None:
+        _LOG = MessageLog()
+    return _LOG
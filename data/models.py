@@ -1,4 +1,4 @@
-from sqlmodel import SQLModel, Field, Column, JSON
+from sqlmodel import SQLModel, Field, Column, JSON, Index
 from typing import Any, Dict, Optional, List
 from pydantic import ConfigDict
 
@@ -9,11 +9,13 @@ class Session(SQLModel, table=True):
     updated_at: int = 0
 
 class Message(SQLModel, table=True):
+    # recent_messages(chat_id, n) walks this index backwards
+    __table_args__ = (Index("ix_message_chat_created", "chat_id", "created_at"),)
     id: Optional[int] = Field(default=None, primary_key=True)
     chat_id: str
     role: str            # user|assistant|tool
     content: str         # text or compact JSON
-    created_at: int = 0
+    created_at: int = 0  # epoch ms
 
 class Device(SQLModel, table=True):
     id: str = Field(primary_key=True)
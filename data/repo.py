@@ -0,0 +1,170 @@
+# data/repo.py
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlmodel import Session as DBSession, SQLModel, create_engine, select
+
+from data.models import Message, Session
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./smarthub.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+# SQLite only: journal mode ("WAL" lets readers run alongside the writer) and lock wait
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+T = TypeVar("T")
+
+_ENGINE: Optional[Engine] = None
+_ENGINE_LOCK = threading.Lock()
+
+def _now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+def _sqlite_pragmas(dbapi_conn, _record) -> None:
+    cur = dbapi_conn.cursor()
+    cur.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cur.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+    cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cur.close()
+
+def get_engine() -> Engine:
+    """One pooled engine per process; tables and indexes are created on first use."""
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                kwargs = {"pool_pre_ping": True}
+                if DATABASE_URL.startswith("sqlite"):
+                    # connections move between to_thread workers; each is used by one thread at a time
+                    kwargs["connect_args"] = {"check_same_thread": False}
+                if ":memory:" not in DATABASE_URL:
+                    kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+                engine = create_engine(DATABASE_URL, **kwargs)
+                if engine.dialect.name == "sqlite":
+                    event.listen(engine, "connect", _sqlite_pragmas)
+                SQLModel.metadata.create_all(engine, tables=[Session.__table__, Message.__table__])
+                _ENGINE = engine
+    return _ENGINE
+
+def dispose_engine() -> None:
+    global _ENGINE
+    if _ENGINE is not None:
+        _ENGINE.dispose()
+    _ENGINE = None
+
+class Repo:
+    """
+    Async access to chat sessions and messages. Every call runs its own short
+    transaction on a pooled connection in a worker thread (asyncio.to_thread),
+    so database I/O never blocks the event loop.
+    """
+    def __init__(self, engine: Optional[Engine] = None):
+        self._engine = engine
+
+    @property
+    def engine(self) -> Engine:
+        return self._engine or get_engine()
+
+    def _tx(self, fn: Callable[[DBSession], T]) -> T:
+        with DBSession(self.engine, expire_on_commit=False) as s:
+            out = fn(s)
+            s.commit()
+            return out
+
+    async def _run(self, fn: Callable[[DBSession], T]) -> T:
+        return await asyncio.to_thread(self._tx, fn)
+
+    # ---------- writes ----------
+    @staticmethod
+    def _touch(s: DBSession, chat_id: str, now: int, tenant_id: Optional[str] = None,
+               summary: Optional[str] = None) -> None:
+        row = s.get(Session, chat_id)
+        if row is None:
+            row = Session(chat_id=chat_id, tenant_id=tenant_id)
+        if tenant_id is not None:
+            row.tenant_id = tenant_id
+        if summary is not None:
+            row.summary_text = summary
+        row.updated_at = now
+        s.add(row)
+
+    async def add_message(self, chat_id: str, role: str, content: str, tenant_id: Optional[str] = None) -> Message:
+        def fn(s: DBSession) -> Message:
+            now = _now_ms()
+            msg = Message(chat_id=chat_id, role=role, content=content, created_at=now)
+            s.add(msg)
+            self._touch(s, chat_id, now, tenant_id)
+            return msg
+        return await self._run(fn)
+
+    async def add_turn(
+        self, chat_id: str, user_message: str, reply: str,
+        tenant_id: Optional[str] = None, summary: Optional[str] = None,
+    ) -> None:
+        """A whole turn (user message, assistant reply, optional new summary) in one transaction."""
+        def fn(s: DBSession) -> None:
+            now = _now_ms()
+            s.add(Message(chat_id=chat_id, role="user", content=user_message, created_at=now))
+            s.add(Message(chat_id=chat_id, role="assistant", content=reply, created_at=now + 1))
+            self._touch(s, chat_id, now + 1, tenant_id, summary)
+        await self._run(fn)
+
+    def write_batch_sync(self, items: List[Dict[str, Any]]) -> None:
+        """
+        Apply queued writes in one transaction. items, in order:
+          {"chat_id", "role", "content", "created_at", "tenant_id"?}   new message
+          {"chat_id", "summary"}                                      summary replacement
+        """
+        def fn(s: DBSession) -> None:
+            touched: Dict[str, Dict[str, Any]] = {}
+            for it in items:
+                t = touched.setdefault(it["chat_id"], {"now": 0, "tenant_id": None, "summary": None})
+                if "summary" in it:
+                    t["summary"] = it["summary"]
+                    t["now"] = max(t["now"], _now_ms())
+                    continue
+                s.add(Message(chat_id=it["chat_id"], role=it["role"], content=it["content"], created_at=it["created_at"]))
+                t["now"] = max(t["now"], it["created_at"])
+                t["tenant_id"] = it.get("tenant_id") or t["tenant_id"]
+            for chat_id, t in touched.items():
+                self._touch(s, chat_id, t["now"], t["tenant_id"], t["summary"])
+        self._tx(fn)
+
+    async def write_batch(self, items: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self.write_batch_sync, items)
+
+    async def update_summary(self, chat_id: str, summary: str) -> None:
+        await self._run(lambda s: self._touch(s, chat_id, _now_ms(), summary=summary))
+
+    # ---------- reads ----------
+    async def load_summary(self, chat_id: str) -> str:
+        def fn(s: DBSession) -> str:
+            row = s.get(Session, chat_id)
+            return row.summary_text if row is not None else ""
+        return await self._run(fn)
+
+    async def recent_messages(self, chat_id: str, n: int = 20) -> List[Message]:
+        """Last n messages of a chat, oldest first."""
+        def fn(s: DBSession) -> List[Message]:
+            stmt = (
+                select(Message)
+                .where(Message.chat_id == chat_id)
+                .order_by(Message.created_at.desc(), Message.id.desc())
+                .limit(n)
+            )
+            return list(reversed(s.exec(stmt).all()))
+        return await self._run(fn)
+
+_REPO: Optional[Repo] = None
+
+def get_repo() -> Repo:
+    global _REPO
+    if _REPO is None:
+        _REPO = Repo()
+    return _REPO
@@ -1,27 +1,33 @@
 # data/search_actions.py
+import asyncio
 from typing import Any, Dict, List, Tuple
 from data.embedding import embed_texts
 from data.vectors_actions import query as query_actions
-from ha.client import HAClient
+from ha.services import get_registry
 
 async def search_actions(text: str, top_k: int = 6, embed_model: str = "nomic-embed-text") -> List[Dict[str, Any]]:
     """
     Text -> embed -> search actions_index -> return fresh resolved actions.
-    We also fetch HA service map to later validate args or expose fields.
+    Field names come from the shared service registry (no /api/services per call).
     """
     qvec = (await embed_texts([text], model=embed_model))[0]
-    hits: List[Tuple[str, float]] = query_actions(qvec, top_k=top_k) or []
+    return await search_actions_by_vector(qvec, top_k=top_k)
 
-    ha = HAClient()
-    svc_map = await ha.services_map()  # {"light":{"turn_on":{...},...},...}
+async def search_actions_by_vector(qvec: List[float], top_k: int = 6) -> List[Dict[str, Any]]:
+    """Same as search_actions for an already-embedded query (lets callers embed once)."""
+    hits: List[Tuple[str, float]] = await asyncio.to_thread(query_actions, qvec, top_k) or []
+    return await resolve_action_hits(hits)
 
+async def resolve_action_hits(hits: List[Tuple[str, float]]) -> List[Dict[str, Any]]:
+    """[(key, score)] from actions_index -> [{key, action, domain, service, fields}]."""
+    registry = get_registry()
     out: List[Dict[str, Any]] = []
     for key, _ in hits:
         kind, ident = key.split(":", 1)
         if kind != "service":
             continue
         domain, service = ident.split(".", 1)
-        fields = list((svc_map.get(domain, {}).get(service, {}).get("fields", {}) or {}).keys())
+        fields = await registry.fields(ident)
         out.append({
             "key": key,
             "action": ident,      # "light.turn_on"
@@ -1,9 +1,9 @@
 # data/search_devices.py
+import asyncio
 from typing import Any, Dict, List, Tuple
-import json
 from data.embedding import embed_texts
 from data.vectors_devices import query as query_devices
-from ha.client import HAClient
+from ha.client import get_ha
 from utils.filters import filter_entity_map
 
 
@@ -13,9 +13,18 @@ async def search_devices(text: str, top_k: int = 6, embed_model: str = "nomic-em
     We fetch *fresh* state to get up-to-date friendly_name and preserve entity_id.
     """
     qvec = (await embed_texts([text], model=embed_model))[0]
-    hits: List[Tuple[str, float]] = query_devices(qvec, top_k=top_k) or []
+    return await search_devices_by_vector(qvec, top_k=top_k)
 
-    ha = HAClient()
+
+async def search_devices_by_vector(qvec: List[float], top_k: int = 6) -> List[Dict[str, Any]]:
+    """Same as search_devices for an already-embedded query (lets callers embed once)."""
+    hits: List[Tuple[str, float]] = await asyncio.to_thread(query_devices, qvec, top_k) or []
+    return await resolve_device_hits(hits)
+
+
+async def resolve_device_hits(hits: List[Tuple[str, float]]) -> List[Dict[str, Any]]:
+    """[(key, score)] from devices_index -> [(entity_id, fresh filtered state)]."""
+    ha = get_ha()
     entity_ids = [ident for (kind, ident) in [k.split(":", 1) for k, _ in hits] if kind == "entity"]
     states = await ha.states_batch(entity_ids)
     state_map = filter_entity_map({s["entity_id"]: s for s in states})
@@ -1,10 +1,11 @@
 # data/search.py
 from __future__ import annotations
-import time
+import asyncio
 from typing import Any, Dict, List, Tuple, Optional
 
 from data.embedding import embed_texts
-from ha.client import HAClient
+from ha.client import HAClient, get_ha
+from ha.services import get_registry
 
 # Import device/actions query funcs
 from data.vectors_devices import query as _query_devices  # (qvec, top_k) -> List[Tuple[key, score]]
@@ -13,27 +14,12 @@ try:
 except Exception:
     _query_actions = None  # actions index not present yet → return []
 
-# tiny cache for HA services to avoid hammering
-_SVC_CACHE: Dict[str, Any] = {}
-_SVC_CACHE_AT = 0.0
-_SVC_TTL = 30.0
-
-async def _services_map(ha: HAClient) -> Dict[str, Dict[str, Any]]:
-    global _SVC_CACHE_AT
-    now = time.time()
-    if _SVC_CACHE and (now - _SVC_CACHE_AT) < _SVC_TTL:
-        return _SVC_CACHE
-    m = await ha.services_map()
-    _SVC_CACHE.clear()
-    _SVC_CACHE.update(m or {})
-    _SVC_CACHE_AT = now
-    return _SVC_CACHE
-
 async def _resolve_devices(ha: HAClient, hits: List[Tuple[str, float]]) -> List[Dict[str, Any]]:
     """[(key, score)] -> [{key, entity_id?, name, domain, area?, services[]}] (no scores in output)"""
-    states = await ha.states()
+    entity_ids = [k.split(":", 1)[1] for k, _ in hits if k.startswith("entity:")]
+    states = await ha.states_batch(entity_ids)
     state_map = {s["entity_id"]: s for s in states}
-    svc_map = await _services_map(ha)
+    svc_map = await get_registry().services_map()
 
     out: List[Dict[str, Any]] = []
     for key, _ in hits:
@@ -78,7 +64,7 @@ async def _resolve_actions(ha: HAClient, hits: List[Tuple[str, float]]) -> List[
     """[(key, score)] -> [{key, action, domain, service, args_schema?}]"""
     if not hits:
         return []
-    svc_map = await _services_map(ha)
+    svc_map = await get_registry().services_map()
 
     out: List[Dict[str, Any]] = []
     for key, _ in hits:
@@ -134,15 +120,19 @@ class Searcher:
         # 1) embed once
         qvec = (await embed_texts([text], model=self.embed_model))[0]
 
-        # 2) vector queries
-        dev_hits: List[Tuple[str, float]] = _query_devices(qvec, top_k=self.top_k_devices) or []
-        act_hits: List[Tuple[str, float]] = []
-        if _query_actions is not None:
-            act_hits = _query_actions(qvec, top_k=self.top_k_actions) or []
+        # 2+3) vector queries and resolution, devices and actions side by side
+        ha = get_ha()
+
+        async def devices_path() -> List[Dict[str, Any]]:
+            hits: List[Tuple[str, float]] = await asyncio.to_thread(_query_devices, qvec, self.top_k_devices) or []
+            return await _resolve_devices(ha, hits)
+
+        async def actions_path() -> List[Dict[str, Any]]:
+            hits: List[Tuple[str, float]] = []
+            if _query_actions is not None:
+                hits = await asyncio.to_thread(_query_actions, qvec, self.top_k_actions) or []
+            return await _resolve_actions(ha, hits)
 
-        # 3) resolve
-        ha = HAClient()
-        devices = await _resolve_devices(ha, dev_hits)
-        actions = await _resolve_actions(ha, act_hits)
+        devices, actions = await asyncio.gather(devices_path(), actions_path())
 
         return {"devices": devices, "actions": actions}
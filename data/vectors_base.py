@@ -0,0 +1,161 @@
+# data/vectors_base.py
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import os
+import threading
+
+import lancedb
+import numpy as np
+
+from data.vectors_memory import MemoryIndex
+
+_DB_PATH = os.getenv("LANCEDB_PATH", "./.lancedb")
+# how stale a cached table handle may be before LanceDB re-checks the latest version
+_REFRESH_S = float(os.getenv("LANCEDB_REFRESH_S", "1.0"))
+# where query() runs: "lancedb" (disk ANN/flat search) or an in-memory copy:
+# "numpy" (exact), "faiss" (flat IP), "faiss_hnsw" (approximate)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "lancedb").strip().lower()
+
+_CONN = None
+_CONN_LOCK = threading.Lock()
+
+def _db():
+    """One LanceDB connection per process; handles opened from it track new versions."""
+    global _CONN
+    if _CONN is None:
+        with _CONN_LOCK:
+            if _CONN is None:
+                _CONN = lancedb.connect(_DB_PATH, read_consistency_interval=timedelta(seconds=_REFRESH_S))
+    return _CONN
+
+def _hash(s: str) -> str:
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+class VectorStore:
+    """
+    One LanceDB table of {key, vector, last_embedding_hash} rows.
+    Keeps the table handle open between calls (writes from other processes
+    become visible within LANCEDB_REFRESH_S) and upserts with merge_insert on key.
+    With a memory backend, query() answers from a MemoryIndex that is reloaded
+    whenever the LanceDB table version changes.
+    Every backend scores hits by cosine similarity, so score thresholds
+    (router, SKIP_SMALL_LLM) mean the same thing whichever backend is used.
+    """
+    def __init__(self, table: str, backend: Optional[str] = None):
+        self.table = table
+        self.backend = backend or VECTOR_BACKEND
+        self._tbl = None
+        self._lock = threading.RLock()
+        self._mem: Optional[MemoryIndex] = None
+        self._mem_version: Optional[int] = None
+
+    # ---------- handles ----------
+    def _open(self):
+        if self._tbl is None:
+            with self._lock:
+                if self._tbl is None:
+                    db = _db()
+                    if self.table not in db.table_names(limit=1_000):
+                        return None
+                    self._tbl = db.open_table(self.table)
+        return self._tbl
+
+    def _forget(self):
+        self._tbl = None
+
+    def exists(self) -> bool:
+        return self._open() is not None
+
+    def version(self) -> Optional[int]:
+        """Latest table version (None if the table doesn't exist)."""
+        tbl = self._open()
+        if tbl is None:
+            return None
+        try:
+            return tbl.version
+        except Exception:
+            # dropped/recreated by another process: reopen once
+            self._forget()
+            tbl = self._open()
+            return tbl.version if tbl is not None else None
+
+    # ---------- writes ----------
+    def add_or_update(self, rows: List[Dict[str, Any]]):
+        """
+        rows: [{"key": "...", "vector": [...], "snapshot": "<json>"}]
+        Upsert keyed on `key` via merge_insert.
+        """
+        if not rows:
+            return
+        data = [{"key": r["key"], "vector": r["vector"], "last_embedding_hash": _hash(r["snapshot"])} for r in rows]
+        tbl = self._open()
+        if tbl is None:
+            with self._lock:
+                self._tbl = _db().create_table(self.table, data=data)
+            return
+        (tbl.merge_insert("key")
+            .when_matched_update_all()
+            .when_not_matched_insert_all()
+            .execute(data))
+
+    def delete_keys(self, keys: List[str], chunk: int = 500):
+        tbl = self._open()
+        if tbl is None or not keys:
+            return
+        for i in range(0, len(keys), chunk):
+            quoted = ",".join("'" + k.replace("'", "''") + "'" for k in keys[i:i + chunk])
+            tbl.delete(f"key IN ({quoted})")
+
+    def reset(self):
+        db = _db()
+        with self._lock:
+            if self.table in db.table_names(limit=1_000):
+                db.drop_table(self.table)
+            self._tbl = None
+
+    # ---------- reads ----------
+    def stored_hashes(self) -> Dict[str, str]:
+        """{key: last_embedding_hash} for every indexed row ({} if the table doesn't exist)."""
+        tbl = self._open()
+        if tbl is None:
+            return {}
+        df = tbl.to_arrow().select(["key", "last_embedding_hash"]).to_pydict()
+        return dict(zip(df["key"], df["last_embedding_hash"]))
+
+    def _memory_index(self) -> MemoryIndex:
+        version = self.version()
+        if version is None:
+            raise RuntimeError(f"LanceDB table '{self.table}' not found; run a sync first.")
+        if self._mem is None or self._mem_version != version:
+            with self._lock:
+                if self._mem is None or self._mem_version != version:
+                    cols = self._open().to_arrow().select(["key", "vector"])
+                    keys = cols.column("key").to_pylist()
+                    vecs = cols.column("vector").combine_chunks()
+                    dim = vecs.type.list_size
+                    matrix = vecs.flatten().to_numpy(zero_copy_only=False).reshape(len(keys), dim)
+                    mem = MemoryIndex(self.backend)
+                    mem.load(keys, np.asarray(matrix, dtype=np.float32))
+                    self._mem, self._mem_version = mem, version
+                    print(f"[vectors] {self.table}: loaded {len(keys)} rows into {mem.kind} (v{version})")
+        return self._mem
+
+    def query(self, qvec: List[float], top_k: int = 6) -> List[Tuple[str, float]]:
+        """[(key, cosine similarity)], best first."""
+        if self.backend != "lancedb":
+            return self._memory_index().search(qvec, top_k=top_k)
+        tbl = self._open()
+        if tbl is None:
+            raise RuntimeError(f"LanceDB table '{self.table}' not found; run a sync first.")
+        # cosine distance (1 - cos) rather than LanceDB's default L2, to match MemoryIndex
+        res = tbl.search(qvec).distance_type("cosine").limit(top_k).to_list()
+        out: List[Tuple[str, float]] = []
+        for r in res:
+            key = r.get("key")
+            if "_distance" in r:
+                score = 1.0 - float(r["_distance"])
+            else:
+                score = float(r.get("score", 0.0))
+            out.append((key, score))
+        return out
@@ -0,0 +1,63 @@
+# data/vectors_memory.py
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import faiss  # faiss-cpu
+except Exception:
+    faiss = None
+
+class MemoryIndex:
+    """
+    Whole index held in RAM as one contiguous float32 matrix (rows L2-normalized,
+    so inner product == cosine similarity and scores are in [-1, 1]).
+
+    kind:
+      - "numpy":      exact inner product, one matmul + argpartition
+      - "faiss":      faiss.IndexFlatIP (exact)
+      - "faiss_hnsw": faiss.IndexHNSWFlat with inner-product metric (approximate)
+    Falls back to numpy if faiss isn't importable.
+    """
+    def __init__(self, kind: str = "numpy", hnsw_m: int = 32):
+        if kind.startswith("faiss") and faiss is None:
+            print(f"[vectors] VECTOR_BACKEND={kind} but faiss is not importable; using numpy")
+            kind = "numpy"
+        self.kind = kind
+        self.hnsw_m = hnsw_m
+        self.keys: List[str] = []
+        self.matrix: Optional[np.ndarray] = None
+        self._faiss = None
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def _normalize(m: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(m, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return m / norms
+
+    def load(self, keys: List[str], matrix: np.ndarray) -> None:
+        self.keys = list(keys)
+        self.matrix = np.ascontiguousarray(self._normalize(matrix.astype(np.float32, copy=False)), dtype=np.float32)
+        self._faiss = None
+        if self.kind == "faiss":
+            self._faiss = faiss.IndexFlatIP(self.matrix.shape[1])
+        elif self.kind == "faiss_hnsw":
+            self._faiss = faiss.IndexHNSWFlat(self.matrix.shape[1], self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        if self._faiss is not None and len(self.keys):
+            self._faiss.add(self.matrix)
+
+    def search(self, qvec: List[float], top_k: int = 6) -> List[Tuple[str, float]]:
+        if self.matrix is None or not self.keys:
+            return []
+        q = self._normalize(np.asarray(qvec, dtype=np.float32).reshape(1, -1))
+        k = min(top_k, len(self.keys))
+        if self._faiss is not None:
+            scores, idx = self._faiss.search(q, k)
+            return [(self.keys[i], float(s)) for i, s in zip(idx[0], scores[0]) if i >= 0]
+        sims = self.matrix @ q[0]
+        top = np.argpartition(-sims, k - 1)[:k] if k < len(sims) else np.arange(len(sims))
+        top = top[np.argsort(-sims[top])]
+        return [(self.keys[i], float(sims[i])) for i in top]
@@ -1,8 +1,9 @@
 # smarthub/ha/client.py
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple, Union
 import httpx
 
 # --- NEW: load .env early ---
@@ -27,10 +28,80 @@ def _build_ha_base_url() -> str:
     port = _env("HA_PORT", "8123")
     return f"{scheme}://{host}:{port}"
 
+# --- shared transport: one pooled AsyncClient per process ---
+# Every HAClient reuses the same keep-alive pool so a turn does not pay a fresh
+# TCP/TLS handshake per state or service lookup. Closed by the app lifespan.
+_HTTP: Optional[httpx.AsyncClient] = None
+
+def _truthy(v: Optional[str]) -> bool:
+    return (v or "").strip().lower() in ("1", "true", "yes", "on")
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(_env("HA_POOL_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(_env("HA_POOL_MAX_KEEPALIVE", "10")),
+        keepalive_expiry=float(_env("HA_POOL_KEEPALIVE_S", "30")),
+    )
+
+def _http2_enabled() -> bool:
+    if not _truthy(_env("HA_HTTP2")):
+        return False
+    try:
+        import h2  # noqa: F401  (pip install "httpx[http2]")
+    except ImportError:
+        print("[ha] HA_HTTP2 is set but 'h2' is not installed; using HTTP/1.1")
+        return False
+    return True
+
+def get_http() -> httpx.AsyncClient:
+    """Process-wide pooled client for Home Assistant REST calls (created lazily)."""
+    global _HTTP
+    if _HTTP is None or _HTTP.is_closed:
+        _HTTP = httpx.AsyncClient(
+            timeout=float(_env("HA_TIMEOUT_S", "15.0")),
+            limits=_pool_limits(),
+            http2=_http2_enabled(),
+        )
+    return _HTTP
+
+async def aclose_http() -> None:
+    """Shutdown hook: drop pooled connections to Home Assistant."""
+    global _HTTP
+    if _HTTP is not None and not _HTTP.is_closed:
+        await _HTTP.aclose()
+    _HTTP = None
+
+_HA: Optional["HAClient"] = None
+
+def get_ha() -> "HAClient":
+    """Shared HAClient (the token/base URL are read once, the pool is shared anyway)."""
+    global _HA
+    if _HA is None:
+        _HA = HAClient()
+    return _HA
+
+# states_batch tuning: per-entity GET concurrency, and the share of the home above
+# which a single /api/states download (filtered locally) beats N lookups.
+_BATCH_CONCURRENCY = int(_env("HA_BATCH_CONCURRENCY", "8"))
+_BATCH_FULL_RATIO = float(_env("HA_BATCH_FULL_RATIO", "0.2"))
+_BATCH_FULL_MIN = int(_env("HA_BATCH_FULL_MIN", "50"))
+_ENTITY_COUNT = 0  # last seen size of /api/states
+
+def _remember_entity_count(n: int) -> None:
+    global _ENTITY_COUNT
+    _ENTITY_COUNT = n
+
+def _live_mirror():
+    """WebSocket state mirror if it is running and has a snapshot, else None (use REST)."""
+    from ha.state_mirror import get_mirror  # local import: state_mirror imports this module
+    mirror = get_mirror()
+    return mirror if mirror is not None and mirror.ready else None
+
 class HAClient:
     """
     Minimal Home Assistant client using REST API.
     Auth: Long-lived token in HA_TOKEN env (loaded from .env if present).
+    All instances share the pooled transport from get_http().
     """
     def __init__(self, timeout: float = 15.0):
         self.base = _build_ha_base_url()
@@ -42,61 +113,118 @@ class HAClient:
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json",
         }
-        self._services_cache: Optional[List[Dict[str, Any]]] = None
 
     async def _get(self, path: str) -> Any:
-        async with httpx.AsyncClient(timeout=self._timeout) as cli:
-            r = await cli.get(f"{self.base}{path}", headers=self._headers)
-            r.raise_for_status()
-            return r.json()
+        r = await get_http().get(f"{self.base}{path}", headers=self._headers, timeout=self._timeout)
+        r.raise_for_status()
+        return r.json()
 
     async def _post(self, path: str, json: Dict[str, Any]) -> Any:
-        async with httpx.AsyncClient(timeout=self._timeout) as cli:
-            r = await cli.post(f"{self.base}{path}", headers=self._headers, json=json)
-            r.raise_for_status()
-            ctype = r.headers.get("content-type", "")
-            return r.json() if ctype.startswith("application/json") else None
+        r = await get_http().post(f"{self.base}{path}", headers=self._headers, json=json, timeout=self._timeout)
+        r.raise_for_status()
+        ctype = r.headers.get("content-type", "")
+        return r.json() if ctype.startswith("application/json") else None
 
     async def states(self) -> List[Dict[str, Any]]:
-        return await self._get("/api/states")
+        mirror = _live_mirror()
+        if mirror is not None:
+            return mirror.all()
+        states = await self._get("/api/states")
+        _remember_entity_count(len(states))
+        return states
 
     async def state(self, entity_id: str) -> Dict[str, Any]:
+        mirror = _live_mirror()
+        if mirror is not None:
+            st = mirror.get(entity_id)
+            if st is not None:
+                return st
         return await self._get(f"/api/states/{entity_id}")
 
     async def states_batch(self, entity_ids: list[str]) -> list[dict]:
-        # Current implementation: dumb loop; optimized later
-        out = []
-        for eid in entity_ids:
-            try:
-                state = await self.state(eid)
-                if state: out.append(state)
-            except Exception:
-                pass
-        return out
+        states, missing = await self.states_batch_report(entity_ids)
+        if missing:
+            print(f"[ha] states_batch: {len(missing)} missing: {', '.join(missing)}")
+        return states
+
+    async def states_batch_report(self, entity_ids: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Fetch several states at once -> (states in request order, missing entity_ids).
+        Order of preference: WebSocket mirror, one /api/states download when the batch
+        is a large share of the home (HA_BATCH_FULL_RATIO), else concurrent per-entity
+        GETs bounded by HA_BATCH_CONCURRENCY. 404s and errors end up in `missing`.
+        """
+        wanted = list(dict.fromkeys(entity_ids))  # dedupe, keep order
+        found: Dict[str, Dict[str, Any]] = {}
+
+        mirror = _live_mirror()
+        if mirror is not None:
+            for eid in wanted:
+                st = mirror.get(eid)
+                if st is not None:
+                    found[eid] = st
+        todo = [eid for eid in wanted if eid not in found]
+
+        if todo and self._prefer_full_download(len(todo)):
+            all_states = await self._get("/api/states")
+            _remember_entity_count(len(all_states))
+            index = {s.get("entity_id"): s for s in all_states}
+            for eid in todo:
+                if eid in index:
+                    found[eid] = index[eid]
+        elif todo:
+            sem = asyncio.Semaphore(_BATCH_CONCURRENCY)
+
+            async def one(eid: str) -> None:
+                async with sem:
+                    try:
+                        st = await self._get(f"/api/states/{eid}")
+                    except httpx.HTTPStatusError as e:
+                        if e.response.status_code != 404:
+                            print(f"[ha] state {eid}: HTTP {e.response.status_code}")
+                        return
+                    except httpx.HTTPError as e:
+                        print(f"[ha] state {eid}: {type(e).__name__}: {e}")
+                        return
+                    if st:
+                        found[eid] = st
+
+            await asyncio.gather(*(one(eid) for eid in todo))
+
+        states = [found[eid] for eid in wanted if eid in found]
+        missing = [eid for eid in wanted if eid not in found]
+        return states, missing
+
+    @staticmethod
+    def _prefer_full_download(n: int) -> bool:
+        total = _ENTITY_COUNT
+        if total:
+            return n >= max(1, int(total * _BATCH_FULL_RATIO))
+        return n >= _BATCH_FULL_MIN  # home size unknown yet
+
+    async def fetch_services(self) -> List[Dict[str, Any]]:
+        """Raw /api/services (uncached; readers should go through ha.services)."""
+        return await self._get("/api/services")
 
+    # service reads are served by the process-wide registry in ha/services.py
     async def services(self) -> List[Dict[str, Any]]:
-        if self._services_cache is None:
-            self._services_cache = await self._get("/api/services")
-        return self._services_cache
+        from ha.services import get_registry
+        return await get_registry().services()
 
     async def services_map(self) -> Dict[str, Dict[str, Any]]:
-        out: Dict[str, Dict[str, Any]] = {}
-        for item in await self.services():
-            dom = item.get("domain")
-            svcs = item.get("services") or {}
-            if isinstance(dom, str) and isinstance(svcs, dict):
-                out[dom] = svcs
-        return out
+        from ha.services import get_registry
+        return await get_registry().services_map()
 
     async def domain_services(self, domain: str) -> Dict[str, Any]:
-        return (await self.services_map()).get(domain, {})
+        from ha.services import get_registry
+        return await get_registry().domain_services(domain)
 
     async def call_service(
         self,
         domain: str,
         service: str,
         service_data: Optional[Dict[str, Any]] = None,
-        entity_id: Optional[str] = None,
+        entity_id: Optional[Union[str, List[str]]] = None,  # a list targets them all in one call
         area_id: Optional[str] = None,
         device_id: Optional[str] = None,
     ) -> Any:
@@ -109,7 +237,7 @@ class HAClient:
             payload["device_id"] = device_id
         return await self._post(f"/api/services/{domain}/{service}", payload)
 
-    async def execute(self, device_id: str, action_id: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    async def execute(self, device_id: Optional[str], action_id: str, args: Dict[str, Any]) -> Dict[str, Any]:
         if "." in action_id:
             domain, service = action_id.split(".", 1)
         else:
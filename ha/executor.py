@@ -0,0 +1,252 @@
+# ha/executor.py
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Literal, Optional, Set, Tuple
+
+from pydantic import BaseModel, Field
+
+from ha.client import _live_mirror, get_ha
+
+# per service call (one group); the whole execution is bounded by the slowest group
+EXEC_TIMEOUT_S = float(os.getenv("EXEC_TIMEOUT_S", "10"))
+# how long to watch for the resulting state changes after a successful call
+EXEC_CONFIRM_TIMEOUT_S = float(os.getenv("EXEC_CONFIRM_TIMEOUT_S", "3"))
+# finished executions kept for /chat/executions/{id} and the log
+EXEC_LOG_SIZE = int(os.getenv("EXEC_LOG_SIZE", "500"))
+
+# state(s) an entity settles in after "domain.service"; actions not listed (scene.turn_on,
+# script.turn_on, set_temperature...) only need *a* change of the entity
+_ON_OFF_DOMAINS = ("light", "switch", "fan", "input_boolean", "humidifier", "siren", "remote", "automation")
+_EXPECTED: Dict[str, Set[str]] = {
+    **{f"{d}.turn_on": {"on"} for d in _ON_OFF_DOMAINS},
+    **{f"{d}.turn_off": {"off"} for d in _ON_OFF_DOMAINS},
+    "climate.turn_on": {"heat", "cool", "heat_cool", "auto", "dry", "fan_only"}, "climate.turn_off": {"off"},
+    "media_player.turn_on": {"on", "idle", "playing", "paused", "buffering", "standby"},
+    "media_player.turn_off": {"off", "standby"},
+    "media_player.media_play": {"playing"}, "media_player.media_pause": {"paused"},
+    "media_player.media_stop": {"idle", "off"},
+    "cover.open_cover": {"open", "opening"}, "cover.close_cover": {"closed", "closing"},
+    "valve.open_valve": {"open", "opening"}, "valve.close_valve": {"closed", "closing"},
+    "lock.lock": {"locked", "locking"}, "lock.unlock": {"unlocked", "unlocking"},
+}
+
+class Command(BaseModel):
+    entity_ids: List[str]
+    action: str                              # "domain.service"
+    args: Dict[str, Any] = Field(default_factory=dict)
+
+class CallGroup(BaseModel):
+    """One call_service for every target sharing action + args."""
+    action: str
+    args: Dict[str, Any] = Field(default_factory=dict)
+    entity_ids: List[str] = Field(default_factory=list)
+    status: Literal["pending", "ok", "error", "timeout"] = "pending"
+    error: Optional[str] = None
+    # entity_id -> True (observed in the expected state) / False (not observed in time)
+    confirmed: Dict[str, bool] = Field(default_factory=dict)
+    ms: float = 0.0
+
+class Execution(BaseModel):
+    id: str
+    created_at: float
+    status: Literal["pending", "ok", "partial", "error", "timeout"] = "pending"
+    groups: List[CallGroup] = Field(default_factory=list)
+    ms: float = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.status != "pending"
+
+    @property
+    def confirmed(self) -> bool:
+        return self.status == "ok" and all(all(g.confirmed.values()) for g in self.groups)
+
+def commands_from_decision(device: Any, action: str, args: Optional[Dict[str, Any]]) -> List[Command]:
+    """EXECUTE decision fields -> commands; device may be one entity_id or a list of them."""
+    args = dict(args or {})
+    targets = args.pop("entity_id", None) or device
+    if isinstance(targets, str):
+        targets = [targets]
+    targets = [t for t in (targets or []) if isinstance(t, str) and t]
+    return [Command(entity_ids=targets, action=action, args=args)] if targets and action else []
+
+def _group_key(cmd: Command) -> Tuple[str, str]:
+    return cmd.action, json.dumps(cmd.args, sort_keys=True, default=str)
+
+def plan(commands: Iterable[Command]) -> List[CallGroup]:
+    """Merge commands that share action + args into one group with all their entity_ids."""
+    groups: "OrderedDict[Tuple[str, str], CallGroup]" = OrderedDict()
+    for cmd in commands:
+        g = groups.get(_group_key(cmd))
+        if g is None:
+            g = groups[_group_key(cmd)] = CallGroup(action=cmd.action, args=dict(cmd.args))
+        g.entity_ids.extend(e for e in cmd.entity_ids if e not in g.entity_ids)
+    return list(groups.values())
+
+class ExecutionEngine:
+    """
+    Fire-and-confirm HA execution. submit() plans the commands into call groups
+    and returns at once; groups are dispatched concurrently, each bounded by
+    EXEC_TIMEOUT_S. A successful call is then confirmed per entity from HA's
+    response, state_changed events (state mirror) or, without the mirror, one
+    REST read. Finished executions stay in a bounded log for status lookups.
+    """
+    def __init__(self, timeout_s: float = EXEC_TIMEOUT_S, confirm_s: float = EXEC_CONFIRM_TIMEOUT_S,
+                 log_size: int = EXEC_LOG_SIZE):
+        self.timeout_s = timeout_s
+        self.confirm_s = confirm_s
+        self.log_size = log_size
+        self._log: "OrderedDict[str, Execution]" = OrderedDict()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._watchers: Dict[str, Set[Callable[[str, Dict[str, Any]], None]]] = {}
+        self.counts = {"ok": 0, "partial": 0, "error": 0, "timeout": 0}
+
+    # ---------- public API ----------
+    def submit(self, commands: Iterable[Command]) -> Execution:
+        exe = Execution(id=uuid.uuid4().hex[:12], created_at=time.time(), groups=plan(commands))
+        self._log[exe.id] = exe
+        while len(self._log) > self.log_size:
+            old_id, old = next(iter(self._log.items()))
+            if not old.done:
+                break  # never drop a running execution
+            del self._log[old_id]
+        task = asyncio.create_task(self._run(exe), name=f"exec-{exe.id}")
+        self._tasks[exe.id] = task
+        task.add_done_callback(lambda _t, i=exe.id: self._tasks.pop(i, None))
+        return exe
+
+    async def run(self, commands: Iterable[Command]) -> Execution:
+        """submit() and wait for the result."""
+        exe = self.submit(commands)
+        return await self.wait(exe.id) or exe
+
+    async def wait(self, exec_id: str, timeout: Optional[float] = None) -> Optional[Execution]:
+        """The execution once finished (or as it stands after `timeout`); None if unknown."""
+        task = self._tasks.get(exec_id)
+        if task is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._log.get(exec_id)
+
+    def get(self, exec_id: str) -> Optional[Execution]:
+        return self._log.get(exec_id)
+
+    def recent(self, n: int = 20) -> List[Execution]:
+        return list(self._log.values())[-n:]
+
+    # ---------- dispatch ----------
+    async def _run(self, exe: Execution) -> None:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(self._run_group(g) for g in exe.groups))
+        statuses = [g.status for g in exe.groups]
+        if statuses and all(s == "ok" for s in statuses):
+            exe.status = "ok"
+        elif any(s == "ok" for s in statuses):
+            exe.status = "partial"
+        elif statuses and all(s == "timeout" for s in statuses):
+            exe.status = "timeout"
+        else:
+            exe.status = "error"
+        exe.ms = round((time.perf_counter() - t0) * 1000, 1)
+        self.counts[exe.status] += 1
+        summary = ", ".join(f"{g.action} x{len(g.entity_ids)} {g.status}" for g in exe.groups)
+        print(f"[exec] {exe.id} {exe.status} in {exe.ms:.0f} ms: {summary}")
+
+    async def _run_group(self, g: CallGroup) -> None:
+        domain, _, service = g.action.partition(".")
+        expected = _EXPECTED.get(g.action)
+        mirror = _live_mirror()
+        seen: Dict[str, Dict[str, Any]] = {}
+        settled = asyncio.Event()
+
+        def ok(eid: str, st: Dict[str, Any]) -> bool:
+            if expected is not None:
+                return st.get("state") in expected
+            # without a known "before" a change can't be told from the old state
+            return eid in before and st.get("last_updated") != before[eid]
+
+        def observe(eid: str, st: Dict[str, Any]) -> None:
+            seen[eid] = st
+            if all(e in seen and ok(e, seen[e]) for e in g.entity_ids):
+                settled.set()
+
+        t0 = time.perf_counter()
+        before: Dict[str, Any] = {}
+        try:
+            if expected is None:
+                # "a change" needs each entity's last_updated from before the call
+                if mirror is not None:
+                    before = {e: (mirror.get(e) or {}).get("last_updated") for e in g.entity_ids}
+                else:
+                    before = {st["entity_id"]: st.get("last_updated") for st in await asyncio.wait_for(
+                        get_ha().states_batch(list(g.entity_ids)), self.timeout_s,
+                    )}
+        except Exception as e:
+            print(f"[exec] {g.action}: no state before the call ({type(e).__name__}); change not confirmable")
+        # watch before dispatching so a fast state change can't slip past
+        for eid in g.entity_ids:
+            self._watchers.setdefault(eid, set()).add(observe)
+        try:
+            target: Any = g.entity_ids[0] if len(g.entity_ids) == 1 else list(g.entity_ids)
+            result = await asyncio.wait_for(
+                get_ha().call_service(domain, service, dict(g.args), entity_id=target), self.timeout_s,
+            )
+            g.status = "ok"
+            # HA answers with the states that changed while the service ran
+            for st in result if isinstance(result, list) else []:
+                if isinstance(st, dict) and st.get("entity_id") in g.entity_ids:
+                    observe(st["entity_id"], st)
+            if not settled.is_set():
+                if mirror is not None:
+                    try:
+                        await asyncio.wait_for(settled.wait(), self.confirm_s)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    missing = [e for e in g.entity_ids if e not in seen]
+                    for st in await get_ha().states_batch(missing) if missing else []:
+                        observe(st["entity_id"], st)
+            g.confirmed = {e: e in seen and ok(e, seen[e]) for e in g.entity_ids}
+        except asyncio.TimeoutError:
+            g.status, g.error = "timeout", f"no answer from HA within {self.timeout_s:.0f}s"
+        except Exception as e:
+            g.status, g.error = "error", f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}"
+        finally:
+            g.ms = round((time.perf_counter() - t0) * 1000, 1)
+            for eid in g.entity_ids:
+                watchers = self._watchers.get(eid)
+                if watchers is not None:
+                    watchers.discard(observe)
+                    if not watchers:
+                        del self._watchers[eid]
+
+    # ---------- state observation ----------
+    def on_state_changed(self, event: Dict[str, Any]) -> None:
+        data = event.get("data") or {}
+        eid, new_state = data.get("entity_id"), data.get("new_state")
+        if not eid or new_state is None:
+            return
+        for watcher in list(self._watchers.get(eid, ())):
+            watcher(eid, new_state)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counts, "running": len(self._tasks), "logged": len(self._log)}
+
+_ENGINE: Optional[ExecutionEngine] = None
+
+def get_executor() -> ExecutionEngine:
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = ExecutionEngine()
+    return _ENGINE
+
+def attach_to_mirror(mirror) -> None:
+    """Confirm executions from live state_changed events."""
+    if mirror is not None:
+        mirror.on_event("state_changed", get_executor().on_state_changed)
@@ -0,0 +1,116 @@
+# smarthub/ha/services.py
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from ha.client import get_ha
+
+# fetches per rebuild while invalidations keep arriving mid-fetch; the last one is used anyway
+_FETCH_ATTEMPTS = 3
+
+class ServiceRegistry:
+    """
+    Process-wide cache of HA's service registry: domain -> service -> schema.
+
+    Built once from /api/services, then kept until HA says otherwise
+    (service_registered / service_removed over the WebSocket mirror) or
+    someone calls refresh(). Per-domain field lists and action dicts are
+    precomputed so prompt building does not walk the raw JSON every turn.
+    """
+    def __init__(self):
+        self._raw: Optional[List[Dict[str, Any]]] = None
+        self._map: Dict[str, Dict[str, Any]] = {}
+        self._fields: Dict[str, List[str]] = {}            # "light.turn_on" -> ["transition", ...]
+        self._actions: Dict[str, List[Dict[str, Any]]] = {}  # "light" -> [{action, domain, service, fields, description}]
+        self._lock = asyncio.Lock()
+        self.version = 0  # bumped on every rebuild
+        self._generation = 0  # bumped on every invalidate; a fetch that saw it change is stale
+
+    # ---------- build / invalidate ----------
+    def invalidate(self, *_: Any) -> None:
+        """Drop the cache; next read rebuilds. Usable directly as an event handler."""
+        self._generation += 1
+        self._raw = None
+
+    async def refresh(self) -> None:
+        self.invalidate()
+        await self._ensure()
+
+    async def _ensure(self) -> None:
+        if self._raw is not None:
+            return
+        async with self._lock:  # single-flight: concurrent readers share one fetch
+            if self._raw is not None:
+                return
+            for attempt in range(_FETCH_ATTEMPTS):
+                generation = self._generation
+                raw = await get_ha().fetch_services()
+                if generation == self._generation:
+                    break
+                # invalidated while fetching: this answer may predate the change
+                print(f"[services] registry changed during fetch {attempt + 1}/{_FETCH_ATTEMPTS}")
+            self._build(raw or [])
+
+    def _build(self, raw: List[Dict[str, Any]]) -> None:
+        svc_map: Dict[str, Dict[str, Any]] = {}
+        fields: Dict[str, List[str]] = {}
+        actions: Dict[str, List[Dict[str, Any]]] = {}
+        for item in raw:
+            dom = item.get("domain")
+            svcs = item.get("services") or {}
+            if not (isinstance(dom, str) and isinstance(svcs, dict)):
+                continue
+            svc_map[dom] = svcs
+            for svc, schema in svcs.items():
+                schema = schema or {}
+                names = list((schema.get("fields") or {}).keys())
+                fields[f"{dom}.{svc}"] = names
+                actions.setdefault(dom, []).append({
+                    "action": f"{dom}.{svc}",
+                    "domain": dom,
+                    "service": svc,
+                    "fields": names,
+                    "description": schema.get("description") or "",
+                })
+        self._map, self._fields, self._actions = svc_map, fields, actions
+        self._raw = raw
+        self.version += 1
+
+    # ---------- reads ----------
+    async def services(self) -> List[Dict[str, Any]]:
+        await self._ensure()
+        return self._raw or []
+
+    async def services_map(self) -> Dict[str, Dict[str, Any]]:
+        await self._ensure()
+        return self._map
+
+    async def domain_services(self, domain: str) -> Dict[str, Any]:
+        await self._ensure()
+        return self._map.get(domain, {})
+
+    async def fields(self, action: str) -> List[str]:
+        """Field names for "domain.service" ([] if unknown)."""
+        await self._ensure()
+        return self._fields.get(action, [])
+
+    async def domain_actions(self, domain: str) -> List[Dict[str, Any]]:
+        """Prompt-ready action dicts for every service of a domain."""
+        await self._ensure()
+        return self._actions.get(domain, [])
+
+_REGISTRY: Optional[ServiceRegistry] = None
+
+def get_registry() -> ServiceRegistry:
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = ServiceRegistry()
+    return _REGISTRY
+
+def attach_to_mirror(mirror) -> None:
+    """Invalidate the registry whenever HA (un)registers a service, or after a reconnect."""
+    reg = get_registry()
+    mirror.on_event("service_registered", reg.invalidate)
+    mirror.on_event("service_removed", reg.invalidate)
+    mirror.on_snapshot(reg.invalidate)
@@ -0,0 +1,218 @@
+# smarthub/ha/state_mirror.py
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import websockets
+
+from ha.client import _build_ha_base_url, _env, _truthy
+
+EventHandler = Callable[[Dict[str, Any]], Optional[Awaitable[None]]]
+
+def _build_ws_url() -> str:
+    url = _env("HA_WS_URL")
+    if url:
+        return url
+    base = _build_ha_base_url()
+    if base.startswith("https://"):
+        base = "wss://" + base[len("https://"):]
+    elif base.startswith("http://"):
+        base = "ws://" + base[len("http://"):]
+    return f"{base}/api/websocket"
+
+class StateMirror:
+    """
+    In-memory copy of Home Assistant entity states, fed by the WebSocket API.
+
+    Connects once, authenticates, subscribes to events, loads a get_states
+    snapshot and then applies state_changed events as they arrive. Reconnects
+    with backoff and reloads the snapshot after every reconnect.
+    Returned state dicts are shared; treat them as read-only.
+    """
+    def __init__(self, url: Optional[str] = None, token: Optional[str] = None, reconnect_max_s: float = 30.0):
+        self.url = url or _build_ws_url()
+        self.token = token or _env("HA_TOKEN")
+        if not self.token:
+            raise RuntimeError("HA_TOKEN is not set.")
+        self._reconnect_max_s = reconnect_max_s
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._next_id = 1
+        self._handlers: Dict[str, List[EventHandler]] = {"state_changed": [self._on_state_changed]}
+        self._snapshot_hooks: List[Callable[[], None]] = []
+
+    # ---------- public read API ----------
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def get(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        return self._states.get(entity_id)
+
+    def all(self) -> List[Dict[str, Any]]:
+        return list(self._states.values())
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def on_event(self, event_type: str, handler: EventHandler) -> None:
+        """Register a handler (sync or async) for an HA event type; subscribed on (re)connect."""
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def on_snapshot(self, hook: Callable[[], None]) -> None:
+        """Called after every (re)loaded snapshot, i.e. after events may have been missed."""
+        self._snapshot_hooks.append(hook)
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="ha-state-mirror")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._task = None
+        self._ready.clear()
+
+    async def _run(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                await self._session()
+                delay = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[ha-ws] connection lost: {type(e).__name__}: {e}; retry in {delay:.0f}s")
+            # while disconnected, readers fall back to REST
+            self._ready.clear()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self._reconnect_max_s)
+
+    # ---------- protocol ----------
+    def _msg_id(self) -> int:
+        i = self._next_id
+        self._next_id += 1
+        return i
+
+    async def _session(self) -> None:
+        async with websockets.connect(self.url, max_size=None) as ws:
+            msg = json.loads(await ws.recv())
+            if msg.get("type") != "auth_required":
+                raise RuntimeError(f"unexpected greeting: {msg.get('type')}")
+            await ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+            msg = json.loads(await ws.recv())
+            if msg.get("type") != "auth_ok":
+                raise RuntimeError(f"auth failed: {msg.get('message') or msg.get('type')}")
+
+            # subscribe BEFORE the snapshot so no change falls in between
+            sub_ids: Dict[int, str] = {}
+            for event_type in self._handlers:
+                mid = self._msg_id()
+                sub_ids[mid] = event_type
+                await ws.send(json.dumps({"id": mid, "type": "subscribe_events", "event_type": event_type}))
+            snap_id = self._msg_id()
+            await ws.send(json.dumps({"id": snap_id, "type": "get_states"}))
+
+            pending: List[Dict[str, Any]] = []  # events seen before the snapshot landed
+            async for raw in ws:
+                msg = json.loads(raw)
+                mtype = msg.get("type")
+                if mtype == "event":
+                    event = msg.get("event") or {}
+                    if self._ready.is_set():
+                        await self._dispatch(event)
+                    else:
+                        pending.append(event)
+                elif mtype == "result" and msg.get("id") == snap_id:
+                    if not msg.get("success"):
+                        raise RuntimeError(f"get_states failed: {msg.get('error')}")
+                    self._states = {
+                        s["entity_id"]: s for s in (msg.get("result") or [])
+                        if isinstance(s, dict) and "entity_id" in s
+                    }
+                    for event in pending:
+                        await self._dispatch(event)
+                    pending.clear()
+                    for hook in self._snapshot_hooks:
+                        hook()
+                    self._ready.set()
+                    print(f"[ha-ws] snapshot loaded: {len(self._states)} entities")
+                elif mtype == "result" and msg.get("id") in sub_ids and not msg.get("success"):
+                    print(f"[ha-ws] subscribe {sub_ids[msg['id']]} failed: {msg.get('error')}")
+
+    async def _dispatch(self, event: Dict[str, Any]) -> None:
+        for handler in self._handlers.get(event.get("event_type"), []):
+            try:
+                res = handler(event)
+                if asyncio.iscoroutine(res):
+                    await res
+            except Exception as e:
+                print(f"[ha-ws] handler error for {event.get('event_type')}: {type(e).__name__}: {e}")
+
+    def _on_state_changed(self, event: Dict[str, Any]) -> None:
+        data = event.get("data") or {}
+        entity_id = data.get("entity_id")
+        if not entity_id:
+            return
+        new_state = data.get("new_state")
+        if new_state is None:
+            self._states.pop(entity_id, None)  # entity removed
+        else:
+            self._states[entity_id] = new_state
+
+# --- process-wide mirror (started by the app lifespan) ---
+_MIRROR: Optional[StateMirror] = None
+
+def mirror_enabled() -> bool:
+    return _truthy(_env("HA_WS_MIRROR", "1"))
+
+def get_mirror() -> Optional[StateMirror]:
+    """The running mirror, or None when it was never started (scripts, tests)."""
+    return _MIRROR
+
+async def start_mirror(wait_s: Optional[float] = None) -> Optional[StateMirror]:
+    """
+    Start the mirror (None when disabled or HA is not configured). Waits at most
+    wait_s (default HA_WS_READY_TIMEOUT_S, 0 = not at all) for the first snapshot;
+    state is served over REST until it arrives.
+    """
+    global _MIRROR
+    if not mirror_enabled():
+        return None
+    if _MIRROR is None:
+        from ha.services import attach_to_mirror
+        try:
+            mirror = StateMirror()
+        except RuntimeError as e:
+            print(f"[ha-ws] mirror not started: {e}")
+            return None
+        _MIRROR = mirror
+        attach_to_mirror(_MIRROR)
+    _MIRROR.start()
+    if wait_s is None:
+        wait_s = float(os.environ.get("HA_WS_READY_TIMEOUT_S", "0"))
+    if wait_s > 0 and not await _MIRROR.wait_ready(wait_s):
+        print(f"[ha-ws] snapshot not ready after {wait_s:.0f}s; serving REST until it is")
+    return _MIRROR
+
+async def stop_mirror() -> None:
+    global _MIRROR
+    if _MIRROR is not None:
+        await _MIRROR.stop()
+    _MIRROR = None
@@ -1,11 +1,21 @@
 # ha/syncer.py
+import hashlib
 import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
 
+from core.llm_client import PRIORITY_BACKGROUND
 from data.embedding import embed_texts
-from data.vectors_devices import add_or_update as add_devices
-from data.vectors_actions import add_or_update as add_actions
-from ha.client import HAClient
+from data.vectors_devices import (
+    add_or_update as add_devices,
+    delete_keys as delete_devices,
+    stored_hashes as stored_device_hashes,
+)
+from data.vectors_actions import (
+    add_or_update as add_actions,
+    delete_keys as delete_actions,
+    stored_hashes as stored_action_hashes,
+)
+from ha.client import get_ha
 
 def _compact_device_json(state: Dict[str, Any]) -> str:
     """
@@ -31,31 +41,76 @@ def _compact_action_json(domain: str, service: str, schema: Dict[str, Any]) -> s
     obj = {"action": f"{domain}.{service}", "domain": domain, "service": service, "fields": fields}
     return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
 
-async def sync_all(embed_model: str = "nomic-embed-text") -> Dict[str, int]:
-    ha = HAClient()
+def _snapshot_hash(snapshot: str) -> str:
+    # must match the last_embedding_hash written by the vector modules
+    return hashlib.sha1(snapshot.encode("utf-8")).hexdigest()
+
+async def _sync_index(
+    items: List[Tuple[str, str]],
+    stored: Dict[str, str],
+    add_rows,
+    delete_keys,
+    embed_model: str,
+    incremental: bool,
+) -> Dict[str, Any]:
+    """
+    items: [(key, snapshot_json)] for everything HA has now.
+    Full mode re-embeds all items. Incremental mode embeds only added/changed
+    keys and deletes keys HA no longer has.
+    """
+    current = dict(items)
+    if incremental:
+        added = [k for k in current if k not in stored]
+        changed = [k for k in current if k in stored and stored[k] != _snapshot_hash(current[k])]
+        removed = [k for k in stored if k not in current]
+    else:
+        added, changed, removed = list(current), [], []
+
+    todo = added + changed
+    # bulk work: queued behind interactive embeds/LLM calls
+    vecs = await embed_texts([current[k] for k in todo], model=embed_model, priority=PRIORITY_BACKGROUND)
+    add_rows([{"key": k, "vector": v, "snapshot": current[k]} for k, v in zip(todo, vecs)])
+    delete_keys(removed)
+    return {
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "unchanged": len(current) - len(todo),
+        "indexed": len(todo),
+    }
+
+async def sync_all(embed_model: str = "nomic-embed-text", incremental: bool = False) -> Dict[str, Any]:
+    """
+    Index HA devices and actions. With incremental=True only rows whose
+    snapshot hash differs from the stored last_embedding_hash are re-embedded,
+    and rows for entities/services that disappeared are deleted.
+    Note: hashes cover the snapshot text only; after changing embed_model
+    run a full sync (or reset) so vectors aren't mixed across models.
+    """
+    ha = get_ha()
 
     # DEVICES
     states: List[Dict[str, Any]] = await ha.states()
-    device_texts: List[str] = [_compact_device_json(st) for st in states]
-    device_vecs = await embed_texts(device_texts, model=embed_model)
-    dev_rows = []
-    for st, snap, vec in zip(states, device_texts, device_vecs):
-        key = f"entity:{st['entity_id']}"
-        dev_rows.append({"key": key, "vector": vec, "snapshot": snap})
-    add_devices(dev_rows)
+    dev_items = [(f"entity:{st['entity_id']}", _compact_device_json(st)) for st in states]
+    dev_report = await _sync_index(
+        dev_items, stored_device_hashes() if incremental else {},
+        add_devices, delete_devices, embed_model, incremental,
+    )
 
     # ACTIONS
     svc_map: Dict[str, Dict[str, Any]] = await ha.services_map()  # {"light":{"turn_on":{schema},...},...}
-    action_pairs: List[tuple[str, str, Dict[str, Any]]] = []
+    act_items: List[Tuple[str, str]] = []
     for domain, svcs in (svc_map or {}).items():
         for service, schema in svcs.items():
-            action_pairs.append((domain, service, schema))
-    action_texts = [_compact_action_json(d, s, schema) for (d, s, schema) in action_pairs]
-    action_vecs = await embed_texts(action_texts, model=embed_model)
-    act_rows = []
-    for (domain, service, _schema), snap, vec in zip(action_pairs, action_texts, action_vecs):
-        key = f"service:{domain}.{service}"
-        act_rows.append({"key": key, "vector": vec, "snapshot": snap})
-    add_actions(act_rows)
-
-    return {"devices_indexed": len(dev_rows), "actions_indexed": len(act_rows)}
+            act_items.append((f"service:{domain}.{service}", _compact_action_json(domain, service, schema)))
+    act_report = await _sync_index(
+        act_items, stored_action_hashes() if incremental else {},
+        add_actions, delete_actions, embed_model, incremental,
+    )
+
+    return {
+        "devices_indexed": dev_report["indexed"],
+        "actions_indexed": act_report["indexed"],
+        "devices": dev_report,
+        "actions": act_report,
+    }
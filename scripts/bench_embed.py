@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Sync-style embedding throughput (texts/s) against a local stub embedder; no Ollama needed.
+import asyncio, time, argparse, hashlib
+import httpx
+from fastapi import FastAPI
+from data.embedding import embed_texts
+from ha.syncer import _compact_device_json
+
+DIM = 768
+
+def _fake_vec(text: str):
+    h = hashlib.sha1(text.encode("utf-8")).digest()
+    return [h[i % len(h)] / 255.0 for i in range(DIM)]
+
+def stub_app(req_ms: float, text_ms: float) -> FastAPI:
+    """Per-request overhead + per-text compute, like a small model on one GPU."""
+    app = FastAPI()
+
+    @app.post("/api/embeddings")
+    async def embeddings(body: dict):
+        await asyncio.sleep((req_ms + text_ms) / 1000)
+        return {"embedding": _fake_vec(body["prompt"])}
+
+    @app.post("/api/embed")
+    async def embed(body: dict):
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep((req_ms + text_ms * len(texts)) / 1000)
+        return {"embeddings": [_fake_vec(t) for t in texts]}
+
+    return app
+
+async def run(texts, client, batch_size, concurrency):
+    t0 = time.perf_counter()
+    vecs = await embed_texts(texts, model="stub", batch_size=batch_size, concurrency=concurrency,
+                             client=client, use_cache=False)
+    dt = time.perf_counter() - t0
+    assert len(vecs) == len(texts)
+    return dt
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=2000, help="number of entity descriptors")
+    ap.add_argument("--req-ms", type=float, default=4.0, help="stub per-request overhead")
+    ap.add_argument("--text-ms", type=float, default=0.5, help="stub per-text compute")
+    args = ap.parse_args()
+
+    states = [{"entity_id": f"light.room_{i}", "attributes": {"friendly_name": f"Room {i} Light"}} for i in range(args.n)]
+    texts = [_compact_device_json(st) for st in states]
+
+    transport = httpx.ASGITransport(app=stub_app(args.req_ms, args.text_ms))
+    async with httpx.AsyncClient(transport=transport, base_url="http://stub") as client:
+        print(f"{'mode':28} {'time_s':>8} {'texts/s':>10}")
+        for label, bs, conc in [
+            ("serial (legacy, bs=1 c=1)", 1, 1),
+            ("batched bs=32 c=1", 32, 1),
+            ("batched bs=64 c=4", 64, 4),
+        ]:
+            dt = await run(texts, client, bs, conc)
+            print(f"{label:28} {dt:8.2f} {len(texts)/dt:10.0f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
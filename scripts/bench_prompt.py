@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# Big-LLM prefill cost per turn for each PROMPT_LAYOUT against a running Ollama.
+# Ollama's prompt_eval_count only counts tokens it had to evaluate, so tokens
+# reused from the KV cache show up as a lower count and a shorter prefill time.
+# --source retrieval takes each turn's candidates from the real pipeline
+# (Interface.retrieve + build_bundle: needs a synced index, HA and the embed model);
+# the synthetic source only imitates it. --offline needs no Ollama: it reports how
+# many (estimated) tokens of each prompt match the previous one's prefix, the most
+# a KV-cache hit could save.
+import asyncio, argparse, os, random, statistics
+from core.big_llm import build_prompt, run_big_llm
+from core.bundle import build_bundle, estimate_tokens, project_device
+from core.llm_client import BIG_MODEL, OllamaClient
+
+ROOMS = ["kitchen", "bedroom", "living room", "office", "hall", "bathroom"]
+KINDS = {"light": "Light", "switch": "Plug", "fan": "Fan", "cover": "Blinds"}
+SERVICES = {"light": ["turn_on", "turn_off", "toggle"], "switch": ["turn_on", "turn_off"],
+            "fan": ["turn_on", "turn_off", "set_percentage"], "cover": ["open_cover", "close_cover"]}
+MESSAGES = ["turn on the {r} light", "is the {r} fan on?", "close the {r} blinds",
+            "switch off the {r} plug", "dim the {r} light to 30%"]
+
+def home():
+    devices, actions = [], []
+    for r in ROOMS:
+        for domain, kind in KINDS.items():
+            eid = f"{domain}.{r.replace(' ', '_')}_{kind.lower()}"
+            devices.append(project_device(eid, {"attributes": {"friendly_name": f"{r.title()} {kind}", "area": r}}))
+    for domain, svcs in SERVICES.items():
+        for s in svcs:
+            actions.append({"action": f"{domain}.{s}", "domain": domain, "service": s, "fields": []})
+    return devices, actions
+
+def turns(n, devices, actions, seed=7):
+    """
+    Retrieval-like candidates: some of the room's devices plus a few near misses
+    that differ every turn, the actions of their domains, in a per-turn score order.
+    """
+    rnd = random.Random(seed)
+    for _ in range(n):
+        room = rnd.choice(ROOMS)
+        local = [d for d in devices if d.get("area") == room]
+        devs = list({d["entity_id"]: d for d in rnd.sample(local, k=3) + rnd.sample(devices, k=3)}.values())
+        domains = {d["entity_id"].split(".", 1)[0] for d in devs}
+        acts = [a for a in actions if a["domain"] in domains]
+        rnd.shuffle(devs)
+        rnd.shuffle(acts)
+        yield rnd.choice(MESSAGES).format(r=room), {"room": room}, devs, acts
+
+async def retrieved_turns(n, seed=7):
+    """Candidates exactly as a live turn would send them."""
+    from core.interface import Interface
+    iface, rnd = Interface(), random.Random(seed)
+    for _ in range(n):
+        room = rnd.choice(ROOMS)
+        msg, ctx = rnd.choice(MESSAGES).format(r=room), {"room": room}
+        _, devices, actions, scores = await iface.retrieve(msg, ctx)
+        bundle = build_bundle(devices, actions, scores)
+        yield msg, ctx, bundle.devices, bundle.actions
+
+async def _synthetic(n):
+    devices, actions = home()
+    for turn in turns(n, devices, actions):
+        yield turn
+
+def _shared(prev, text):
+    """(shared prefix tokens, prompt tokens) as Ollama would see the rendered prompts."""
+    return estimate_tokens(os.path.commonprefix([prev, text])) if prev else 0, estimate_tokens(text)
+
+async def run(layout, n, model, source, offline=False):
+    counts, ms, prev = [], [], ""
+    async for msg, ctx, devs, acts in (retrieved_turns(n) if source == "retrieval" else _synthetic(n)):
+        if offline:
+            system, prompt = build_prompt(msg, ctx, devs, acts, layout)
+            text = f"{system}\n{prompt}"
+            shared, total = _shared(prev, text)
+            counts.append(total - shared)
+            ms.append(shared)
+            prev = text
+            continue
+        meta = {}
+        await run_big_llm(msg, ctx, devs, acts, model=model, layout=layout, meta=meta)
+        if "prompt_eval_count" in meta:
+            counts.append(meta["prompt_eval_count"])
+            ms.append(meta.get("prompt_eval_duration", 0) / 1e6)
+    return counts, ms
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--n", type=int, default=20, help="turns per layout")
+    ap.add_argument("--model", default=BIG_MODEL)
+    ap.add_argument("--source", choices=["synthetic", "retrieval"], default="synthetic",
+                    help="where each turn's candidates come from")
+    ap.add_argument("--offline", action="store_true",
+                    help="estimate prefix reuse from the prompts instead of calling Ollama")
+    args = ap.parse_args()
+
+    if args.offline:
+        print(f"{'layout':22} {'new_tok':>12} {'shared_tok':>11}   (estimated, median over turns 2..n)")
+    else:
+        await OllamaClient().load(args.model)
+        print(f"{'layout':22} {'prefill_tok':>12} {'prefill_ms':>11}   (median over turns 2..n)")
+    for label in ("legacy", "prefix"):
+        counts, ms = await run(label, args.n, args.model, args.source, args.offline)
+        if len(counts) < 2:
+            print(f"{label:22} {'n/a':>12} {'n/a':>11}")
+            continue
+        # first turn is a cold prefix for every layout
+        print(f"{label:22} {statistics.median(counts[1:]):12.0f} {statistics.median(ms[1:]):11.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
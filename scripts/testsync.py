@@ -8,19 +8,24 @@ async def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--reset", action="store_true", help="drop both indices before syncing")
     ap.add_argument("--model", default="nomic-embed-text")
+    ap.add_argument("--incremental", action="store_true", help="re-embed only changed rows, drop stale ones")
     args = ap.parse_args()
 
     if args.reset:
         reset_devices()
         reset_actions()
 
-    print("Starting full sync (devices + actions)...")
+    mode = "incremental" if args.incremental else "full"
+    print(f"Starting {mode} sync (devices + actions)...")
     t0 = time.perf_counter()
-    result = await sync_all(embed_model=args.model)
+    result = await sync_all(embed_model=args.model, incremental=args.incremental)
     dt = (time.perf_counter() - t0) * 1000
     print(f"Sync complete in {dt:.1f} ms")
     print(f"Devices indexed: {result['devices_indexed']}")
     print(f"Actions indexed: {result['actions_indexed']}")
+    for kind in ("devices", "actions"):
+        rep = result[kind]
+        print(f"  {kind}: +{len(rep['added'])} ~{len(rep['changed'])} -{len(rep['removed'])} ={rep['unchanged']}")
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# Exercise ha.state_mirror against a local stand-in for the HA WebSocket API (no real HA needed).
+import asyncio, json, time
+import websockets
+from ha.state_mirror import StateMirror
+
+TOKEN = "test-token"
+STATES = [
+    {"entity_id": "light.kitchen", "state": "off", "attributes": {"friendly_name": "Kitchen Light"}},
+    {"entity_id": "fan.bedroom", "state": "on", "attributes": {"friendly_name": "Bedroom Fan"}},
+]
+
+def _event(sub_id, entity_id, new_state):
+    return json.dumps({"id": sub_id, "type": "event", "event": {
+        "event_type": "state_changed",
+        "data": {"entity_id": entity_id, "old_state": None, "new_state": new_state},
+    }})
+
+async def fake_ha(ws, *_):
+    try:
+        await _serve(ws)
+    except websockets.ConnectionClosed:
+        pass  # mirror.stop() cancels mid-stream
+
+async def _serve(ws):
+    await ws.send(json.dumps({"type": "auth_required"}))
+    auth = json.loads(await ws.recv())
+    if auth.get("access_token") != TOKEN:
+        await ws.send(json.dumps({"type": "auth_invalid", "message": "bad token"}))
+        return
+    await ws.send(json.dumps({"type": "auth_ok"}))
+    sub_id = None
+    async for raw in ws:
+        msg = json.loads(raw)
+        if msg["type"] == "subscribe_events" and msg.get("event_type") == "state_changed":
+            sub_id = msg["id"]
+            await ws.send(json.dumps({"id": msg["id"], "type": "result", "success": True, "result": None}))
+        elif msg["type"] == "subscribe_events":
+            await ws.send(json.dumps({"id": msg["id"], "type": "result", "success": True, "result": None}))
+        elif msg["type"] == "get_states":
+            await ws.send(json.dumps({"id": msg["id"], "type": "result", "success": True, "result": STATES}))
+            # live changes after the snapshot
+            await ws.send(_event(sub_id, "light.kitchen", {**STATES[0], "state": "on"}))
+            await ws.send(_event(sub_id, "fan.bedroom", None))
+            await ws.send(_event(sub_id, "switch.pump", {"entity_id": "switch.pump", "state": "off", "attributes": {}}))
+
+async def main():
+    async with websockets.serve(fake_ha, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        mirror = StateMirror(url=f"ws://127.0.0.1:{port}", token=TOKEN)
+        t0 = time.perf_counter()
+        mirror.start()
+        assert await mirror.wait_ready(5), "snapshot never arrived"
+        print(f"Snapshot ready in {(time.perf_counter() - t0)*1000:.1f} ms")
+        await asyncio.sleep(0.2)  # let the follow-up events land
+        assert mirror.get("light.kitchen")["state"] == "on", mirror.get("light.kitchen")
+        assert mirror.get("fan.bedroom") is None
+        assert mirror.get("switch.pump") is not None
+        print(f"Entities mirrored: {len(mirror)} -> {sorted(s['entity_id'] for s in mirror.all())}")
+        await mirror.stop()
+    print("OK")
+
+if __name__ == "__main__":
+    asyncio.run(main())
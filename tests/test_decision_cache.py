@@ -0,0 +1,35 @@
+# tests/test_decision_cache.py
+from core.big_llm import Decision
+from core.decision_cache import DecisionCache, refers_back
+
+DEVICES = [("light.kitchen", {"state": "off", "attributes": {"friendly_name": "Kitchen Light"}})]
+ACTIONS = ["light.turn_on", "light.turn_off"]
+
+def _key(message, recent="", devices=DEVICES):
+    return DecisionCache.key("big", message, {"room": "kitchen"}, devices, [d for d, _ in devices], ACTIONS, recent)
+
+def test_repeated_command_hits_in_ongoing_chat():
+    cache = DecisionCache()
+    decision = Decision(mode="EXECUTE", device="light.kitchen", action="light.turn_on", reply="Done.")
+    cache.put(_key("Turn on the kitchen light", recent='[{"u":"hi"}]'), "{}", decision, ["light.kitchen"])
+    # the chat has moved on since; the same command still hits
+    hit = cache.get(_key("turn on the kitchen light!", recent='[{"u":"hi"},{"a":"Hello"},{"u":"thanks"}]'))
+    assert hit is not None and hit[1] == decision
+    assert cache.stats()["hits"] == 1
+
+def test_back_reference_keys_on_history():
+    assert _key("turn it off", recent='[{"u":"turn on the kitchen light"}]') != \
+        _key("turn it off", recent='[{"u":"turn on the hallway light"}]')
+    assert _key("turn off the kitchen light", recent="a") == _key("turn off the kitchen light", recent="b")
+
+def test_refers_back():
+    assert refers_back("Do that again")
+    assert refers_back("turn them off")
+    assert not refers_back("turn off the kitchen light")
+
+def test_state_change_misses():
+    cache = DecisionCache()
+    decision = Decision(mode="EXECUTE", device="light.kitchen", action="light.turn_on")
+    cache.put(_key("turn on the kitchen light"), "{}", decision, ["light.kitchen"])
+    on = [("light.kitchen", {"state": "on", "attributes": {"friendly_name": "Kitchen Light"}})]
+    assert cache.get(_key("turn on the kitchen light", devices=on)) is None
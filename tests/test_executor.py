@@ -0,0 +1,48 @@
+# tests/test_executor.py
+import asyncio
+
+import pytest
+
+import ha.executor as executor
+from ha.executor import Command, ExecutionEngine
+
+class FakeHA:
+    """call_service flips states the way HA would; states_batch reads them over 'REST'."""
+    def __init__(self, states, after):
+        self.states, self.after, self.reads = states, after, 0
+
+    async def call_service(self, domain, service, data, entity_id=None):
+        for eid in [entity_id] if isinstance(entity_id, str) else entity_id:
+            self.states[eid] = {"entity_id": eid, **self.after[eid]}
+        return []
+
+    async def states_batch(self, entity_ids):
+        self.reads += 1
+        return [dict(self.states[e]) for e in entity_ids if e in self.states]
+
+@pytest.fixture
+def ha(monkeypatch):
+    def make(states, after):
+        fake = FakeHA({e: {"entity_id": e, **st} for e, st in states.items()}, after)
+        monkeypatch.setattr(executor, "get_ha", lambda: fake)
+        monkeypatch.setattr(executor, "_live_mirror", lambda: None)
+        return fake
+    return make
+
+def _run(action, entity_id):
+    return asyncio.run(ExecutionEngine(confirm_s=0.1).run([Command(entity_ids=[entity_id], action=action)]))
+
+def test_climate_turn_on_confirms_with_hvac_mode(ha):
+    ha({"climate.hall": {"state": "off", "last_updated": "1"}}, {"climate.hall": {"state": "heat", "last_updated": "2"}})
+    assert _run("climate.turn_on", "climate.hall").confirmed
+
+def test_scene_confirms_on_change_read_over_rest(ha):
+    fake = ha({"scene.movie": {"state": "2026-01-01", "last_updated": "1"}},
+              {"scene.movie": {"state": "2026-10-17", "last_updated": "2"}})
+    assert _run("scene.turn_on", "scene.movie").confirmed
+    assert fake.reads == 2  # before the call and after it
+
+def test_unchanged_entity_is_not_confirmed(ha):
+    ha({"script.night": {"state": "off", "last_updated": "1"}}, {"script.night": {"state": "off", "last_updated": "1"}})
+    exe = _run("script.turn_on", "script.night")
+    assert exe.status == "ok" and not exe.confirmed
@@ -0,0 +1,66 @@
+# tests/test_fast_path.py
+import pytest
+
+from core.fast_path import FastPath
+
+STATES = [
+    {"entity_id": "light.kitchen", "attributes": {"friendly_name": "Kitchen Light", "area": "kitchen"}},
+    {"entity_id": "light.bedroom", "attributes": {"friendly_name": "Bedroom Light", "area": "bedroom"}},
+    {"entity_id": "cover.bedroom_curtains", "attributes": {"friendly_name": "Bedroom Curtains", "area": "bedroom"}},
+    {"entity_id": "lock.front_door", "attributes": {"friendly_name": "Front Door"}},
+    {"entity_id": "media_player.living_room", "attributes": {"friendly_name": "Living Room Speaker"}},
+]
+SERVICES = {
+    "light": {"turn_on": {}, "turn_off": {}, "toggle": {}},
+    "cover": {"open_cover": {}, "close_cover": {}, "stop_cover": {}},
+    "lock": {"lock": {}, "unlock": {}, "open": {}},
+    "media_player": {"turn_on": {}, "turn_off": {}, "media_play": {}, "media_pause": {}, "media_stop": {}},
+}
+
+@pytest.fixture
+def fp():
+    fp = FastPath()
+    fp.build(STATES, SERVICES)
+    return fp
+
+def test_direct_command(fp):
+    m = fp.match("turn off the kitchen light")
+    assert (m.device, m.action) == ("light.kitchen", "light.turn_off")
+
+def test_pair_noun_is_one_device(fp):
+    m = fp.match("close the bedroom curtains")
+    assert (m.device, m.action) == ("cover.bedroom_curtains", "cover.close_cover")
+
+@pytest.mark.parametrize("message", [
+    "turn off all the lights",
+    "turn off every light",
+    "turn off the lights",
+    "switch on the lamps",
+])
+def test_several_devices_go_to_llm(fp, message):
+    assert fp.match(message, {"room": "kitchen"}) is None
+
+@pytest.mark.parametrize("message", [
+    "open the door",
+    "open the front door",
+    "unlock the front door",
+    "lock the front door",
+])
+def test_locks_never_fast_path(fp, message):
+    assert fp.match(message) is None
+
+def test_stop_music_stops_playback(fp):
+    m = fp.match("stop the music")
+    assert (m.device, m.action) == ("media_player.living_room", "media_player.media_stop")
+
+def test_negation_goes_to_llm(fp):
+    assert fp.match("don't turn off the kitchen light") is None
+
+def test_generic_noun_needs_room(fp):
+    # two lights and no room: ambiguous, left to the LLM
+    assert fp.match("turn off the light") is None
+    m = fp.match("turn off the light", {"room": "kitchen"})
+    assert m.device == "light.kitchen"
+
+def test_values_go_to_llm(fp):
+    assert fp.match("turn on the kitchen light to 50") is None
@@ -0,0 +1,22 @@
+# tests/test_intent_extractor.py
+import pytest
+
+from core.intent_extractor import maybe_multi
+
+@pytest.mark.parametrize("message", [
+    "turn off the kitchen light and close the bedroom curtains",
+    "dim the lights, then play some music",
+    "lock the front door; turn off the porch light",
+])
+def test_several_commands(message):
+    assert maybe_multi(message)
+
+@pytest.mark.parametrize("message", [
+    "set it to 50%, please",
+    "turn on the black and white lamp",
+    "turn off the lamp and the fan",
+    "is the door locked and the oven off?",
+    "turn on the kitchen light",
+])
+def test_single_command(message):
+    assert not maybe_multi(message)
@@ -0,0 +1,58 @@
+# tests/test_jsonio.py
+import json
+
+import pytest
+
+from utils.jsonio import JsonStreamParser, parse_one_line_json
+
+def _run(text, chunk=1, keys=("reply",)):
+    parser = JsonStreamParser(stream_keys=keys)
+    events = []
+    for i in range(0, len(text), chunk):
+        events.extend(parser.feed(text[i:i + chunk]))
+    deltas = "".join(t for kind, _, t in events if kind == "delta")
+    return parser, events, deltas
+
+@pytest.mark.parametrize("chunk", [1, 2, 3, 7, 1000])
+def test_chunked_feed_streams_reply(chunk):
+    obj = {"mode": "REPLY", "reply": "Lights are off.", "args": {"a": [1, 2]}}
+    parser, events, deltas = _run(json.dumps(obj), chunk)
+    assert deltas == "Lights are off."
+    assert parser.done and parser.obj == obj
+    assert [k for kind, k, _ in events if kind == "field"] == ["mode", "reply", "args"]
+
+@pytest.mark.parametrize("chunk", [1, 2, 5])
+def test_escapes(chunk):
+    reply = 'say "hi"\\n\tback\\slash / caf\u00e9'
+    parser, _, deltas = _run(json.dumps({"reply": reply}), chunk)
+    assert deltas == reply
+    assert parser.obj == {"reply": reply}
+
+@pytest.mark.parametrize("chunk", [1, 3, 6, 13])
+def test_surrogate_pairs(chunk):
+    reply = "done \U0001F4A1 and \U0001F600!"
+    text = json.dumps({"reply": reply})   # ensure_ascii: "\ud83d\udca1" pairs
+    assert "\\ud83d" in text
+    _, events, deltas = _run(text, chunk)
+    assert deltas == reply
+    assert not any(0xD800 <= ord(c) <= 0xDFFF for kind, _, t in events if kind == "delta" for c in t)
+
+def test_unpaired_surrogate_is_replaced():
+    _, _, deltas = _run('{"reply": "a\\ud83d b\\udca1"}')
+    assert deltas == "a\ufffd b\ufffd"
+
+def test_nested_braces_in_values_and_strings():
+    obj = {"args": {"x": {"y": "}{]["}}, "reply": "ok {not} [json]"}
+    parser, _, deltas = _run(json.dumps(obj), 4)
+    assert parser.obj == obj
+    assert deltas == "ok {not} [json]"
+
+def test_prose_and_fences_around_the_object():
+    text = 'Sure!\n```json\n{"mode": "EXECUTE", "device": "light.kitchen"}\n```\nAnything else? {"x": 1}'
+    parser, events, _ = _run(text, 5)
+    assert parser.obj == {"mode": "EXECUTE", "device": "light.kitchen"}
+    assert sum(1 for kind, _, _ in events if kind == "done") == 1
+    assert parse_one_line_json(text) == parser.obj
+
+def test_incomplete_object():
+    assert parse_one_line_json('{"mode": "REPLY", "reply": "cut') is None
@@ -0,0 +1,71 @@
+# tests/test_message_log.py
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from data.message_log import MessageLog
+
+class FakeRepo:
+    def __init__(self):
+        self.rows, self.fail_loads, self.commit_gate = [], 0, None
+
+    async def recent_messages(self, chat_id, n):
+        if self.fail_loads:
+            self.fail_loads -= 1
+            raise ConnectionError("database is down")
+        return [r for r in self.rows if r.chat_id == chat_id][-n:]
+
+    async def load_summary(self, chat_id):
+        return ""
+
+    def write_batch_sync(self, items):
+        if self.commit_gate is not None:
+            self.commit_gate.wait(2)
+        self.rows += [SimpleNamespace(**it) for it in items if "summary" not in it]
+
+    async def write_batch(self, items):
+        await asyncio.to_thread(self.write_batch_sync, items)
+
+def test_turns_keep_their_order_within_a_millisecond(monkeypatch):
+    monkeypatch.setattr("data.message_log._now_ms", lambda: 1000)
+    log = MessageLog(repo=FakeRepo())
+
+    async def go():
+        await asyncio.gather(log.add_turn("c", "u0", "a0"), log.add_turn("c", "u1", "a1"))
+        await log.close()
+        return await log.repo.recent_messages("c", 10)
+
+    rows = asyncio.run(go())
+    assert [r.content for r in sorted(rows, key=lambda r: r.created_at)] == ["u0", "a0", "u1", "a1"]
+
+def test_failed_load_is_retried():
+    repo = FakeRepo()
+    repo.rows = [SimpleNamespace(chat_id="c", role="user", content="old", created_at=1)]
+    repo.fail_loads = 1
+    log = MessageLog(repo=repo)
+
+    async def go():
+        first = await log.recent("c")
+        await log.append("c", "user", "new")
+        second = await log.recent("c")
+        await log.close()
+        return first, second
+
+    first, second = asyncio.run(go())
+    assert first == []
+    assert [m["content"] for m in second] == ["old", "new"]
+
+def test_close_timeout_does_not_write_a_running_commit_twice():
+    repo = FakeRepo()
+    repo.commit_gate = threading.Event()
+    log = MessageLog(repo=repo)
+
+    async def go():
+        await log.add_turn("c", "hi", "hello")
+        await asyncio.sleep(0.2)          # the writer is now blocked inside the commit
+        await log.close(timeout=0.1)
+        repo.commit_gate.set()            # the commit goes through after close() gave up
+        await asyncio.sleep(0.1)
+
+    asyncio.run(go())
+    assert [r.content for r in repo.rows] == ["hi", "hello"]
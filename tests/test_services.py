@@ -0,0 +1,30 @@
+# tests/test_services.py
+import asyncio
+
+import ha.services as services
+from ha.services import ServiceRegistry
+
+class FakeHA:
+    """Each fetch returns a new registry snapshot: d1, d2, ..."""
+    def __init__(self):
+        self.fetches = 0
+
+    async def fetch_services(self):
+        self.fetches += 1
+        n = self.fetches
+        await asyncio.sleep(0.05)
+        return [{"domain": f"d{n}", "services": {"turn_on": {}}}]
+
+def test_invalidate_during_fetch_refetches(monkeypatch):
+    fake = FakeHA()
+    monkeypatch.setattr(services, "get_ha", lambda: fake)
+    reg = ServiceRegistry()
+
+    async def go():
+        reading = asyncio.create_task(reg.services())
+        await asyncio.sleep(0.01)
+        reg.invalidate()              # e.g. service_registered arrives mid-fetch
+        return await reading
+
+    assert [s["domain"] for s in asyncio.run(go())] == ["d2"]
+    assert fake.fetches == 2
@@ -1,12 +1,10 @@
-import json, re
+import json
 
 def parse_one_line_json(text: str):
-    m = re.search(r"\{.*\}", text.strip(), flags=re.DOTALL)
-    if not m: return None
-    try:
-        return json.loads(m.group(0))
-    except Exception:
-        return None
+    """First complete top-level JSON object in text (prose/code fences around it are ignored)."""
+    parser = JsonStreamParser()
+    parser.feed(text or "")
+    return parser.obj if parser.done else None
 
 def clamp_value(args: dict, hint: dict) -> dict:
     rng = hint.get("value_range")
@@ -17,3 +15,157 @@ def clamp_value(args: dict, hint: dict) -> dict:
         except Exception:
             pass
     return args
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+class JsonStreamParser:
+    """
+    Incremental parser for ONE top-level JSON object arriving in chunks (LLM tokens).
+
+    feed(chunk) returns events as soon as they are known:
+      ("delta", key, text)   - new characters of a top-level string value whose key is in stream_keys
+      ("field", key, value)  - a top-level field is complete (value already json-decoded)
+      ("done", None, obj)    - the top-level object closed; anything after it is ignored
+    Text before the opening brace (prose, code fences) is skipped.
+    """
+    def __init__(self, stream_keys=()):
+        self.stream_keys = set(stream_keys)
+        self.fields = {}
+        self.obj = None
+        self.done = False
+        self._buf = []
+        self._started = False
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._uni = None        # hex digits of a pending \uXXXX inside a streamed string
+        self._high = None       # high surrogate of a \uD83D\uDE00 pair waiting for its low half
+        self._state = "key"     # top level: key | colon | value | prim | after
+        self._key = None
+        self._tok_start = 0     # buf index where the current top-level key/value started
+        self._streaming = False
+
+    @property
+    def text(self) -> str:
+        """Raw text of the object consumed so far (from the opening brace)."""
+        return "".join(self._buf)
+
+    def feed(self, chunk: str):
+        events = []
+        for ch in chunk:
+            if self.done:
+                break
+            if not self._started:
+                if ch == "{":
+                    self._started, self._depth = True, 1
+                    self._buf.append(ch)
+                continue
+            self._buf.append(ch)
+            i = len(self._buf) - 1
+            if self._in_str:
+                self._string_char(ch, i, events)
+                continue
+            if self._depth > 1:
+                if ch == '"':
+                    self._in_str = True
+                elif ch in "{[":
+                    self._depth += 1
+                elif ch in "}]":
+                    self._depth -= 1
+                    if self._depth == 1:
+                        self._finish_field(i + 1, events)
+                continue
+            # depth == 1: between top-level tokens
+            st = self._state
+            if st == "prim" and ch in ",}":
+                self._finish_field(i, events)
+                st = self._state
+            if ch.isspace():
+                continue
+            if st == "key" and ch == '"':
+                self._in_str, self._tok_start = True, i
+            elif st == "colon" and ch == ":":
+                self._state = "value"
+            elif st == "value":
+                self._tok_start = i
+                if ch == '"':
+                    self._in_str = True
+                    self._streaming = self._key in self.stream_keys
+                elif ch in "{[":
+                    self._depth += 1
+                else:
+                    self._state = "prim"
+            elif st in ("key", "after") and ch == ",":
+                self._state = "key"
+            if ch == "}" and self._state in ("key", "after"):
+                self._close(events)
+        return events
+
+    def _string_char(self, ch, i, events):
+        if self._uni is not None:
+            self._uni += ch
+            if len(self._uni) == 4:
+                try:
+                    self._code_unit(int(self._uni, 16), events)
+                except ValueError:
+                    pass
+                self._uni = None
+            return
+        if self._esc:
+            self._esc = False
+            if self._streaming:
+                if ch == "u":
+                    self._uni = ""
+                else:
+                    self._delta(_ESCAPES.get(ch, ch), events)
+            return
+        if ch == "\\":
+            self._esc = True
+        elif ch == '"':
+            self._in_str = False
+            if self._high is not None:
+                self._delta("", events)   # unpaired high surrogate at the end of the string
+            if self._depth == 1 and self._state == "key":
+                self._key = json.loads("".join(self._buf[self._tok_start:i + 1]))
+                self._state = "colon"
+            elif self._depth == 1:
+                self._finish_field(i + 1, events)
+        elif self._streaming:
+            self._delta(ch, events)
+
+    def _code_unit(self, cu, events):
+        # JSON escapes astral characters as two \uXXXX halves: emit them as one character
+        if 0xD800 <= cu <= 0xDBFF:
+            if self._high is not None:
+                self._delta("", events)
+            self._high = cu
+        elif 0xDC00 <= cu <= 0xDFFF and self._high is not None:
+            high, self._high = self._high, None
+            events.append(("delta", self._key, chr(0x10000 + ((high - 0xD800) << 10) + (cu - 0xDC00))))
+        else:
+            self._delta("\ufffd" if 0xDC00 <= cu <= 0xDFFF else chr(cu), events)
+
+    def _delta(self, text, events):
+        if self._high is not None:
+            self._high = None
+            events.append(("delta", self._key, "\ufffd"))
+        if text:
+            events.append(("delta", self._key, text))
+
+    def _finish_field(self, end, events):
+        raw = "".join(self._buf[self._tok_start:end]).strip()
+        try:
+            value = json.loads(raw)
+        except Exception:
+            value = raw
+        self.fields[self._key] = value
+        events.append(("field", self._key, value))
+        self._state, self._streaming = "after", False
+
+    def _close(self, events):
+        self._depth, self.done = 0, True
+        try:
+            self.obj = json.loads("".join(self._buf))
+        except Exception:
+            self.obj = dict(self.fields)
+        events.append(("done", None, self.obj))